@@ -2,16 +2,68 @@
 
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+import json
 import threading
 import time
 
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn, thiếu thì dùng jsonify
+    orjson = None
+
+try:
+    from waitress import serve
+except ImportError:  # waitress là tùy chọn, thiếu thì dùng server của Flask (threaded)
+    serve = None
+
 from sound_service import SoundDetectionService
 
 app = Flask(__name__)
 CORS(app)
 
 service = None
+# Chỉ khóa khi start/stop (đổi tham chiếu service); các handler khác chỉ đọc
+# nên lấy tham chiếu service 1 lần, không chờ nhau
 service_lock = threading.Lock()
+API_THREADS = 8
+# /status/stream gửi comment ping nếu state không đổi trong khoảng này (giữ kết nối)
+SSE_KEEPALIVE_SEC = 15
+# Mỗi client /status/stream giữ 1 thread waitress suốt kết nối (client ngắt thì thread chỉ
+# được trả ở lần ghi kế tiếp, tối đa SSE_KEEPALIVE_SEC). Giới hạn số stream thấp hơn
+# API_THREADS để các route khác (/status, /stop...) luôn còn thread; quá giới hạn -> 503
+MAX_SSE_STREAMS = 4
+_sse_slots = threading.BoundedSemaphore(MAX_SSE_STREAMS)
+
+# Cache JSON đã serialize: (key, bytes). key đổi thì serialize lại, còn không trả thẳng bytes cũ.
+# /status: key = chính object State (mỗi tick _run_loop tạo State mới, nên rms/timestamp
+# luôn mới; cache giữ tham chiếu nên object không bị giải phóng rồi trùng lại).
+# /history: key = (instance_id, số event, limit)
+_status_cache = (None, b'')
+_history_cache = (None, b'')
+
+
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+
+def _json_response(body: bytes):
+    return app.response_class(body, mimetype='application/json')
+
+
+def _status_body(svc) -> bytes:
+    """JSON /status của svc, chỉ serialize lại khi có tick mới (State mới)"""
+    global _status_cache
+    state = svc.current_state
+    cached_state, body = _status_cache
+    if cached_state is not state:
+        body = _dumps({
+            'running': True,
+            'state': svc.state_to_dict(state)
+        })
+        _status_cache = (state, body)
+    return body
 
 
 @app.route('/')
@@ -21,6 +73,7 @@ def index():
         'version': '1.0.0',
         'endpoints': {
             'GET /status': 'Lấy trạng thái hiện tại',
+            'GET /status/stream': f'Server-Sent Events: đẩy trạng thái mỗi khi thay đổi (tối đa {MAX_SSE_STREAMS} client, quá thì 503)',
             'GET /statistics': 'Lấy thống kê',
             'GET /history': 'Lấy lịch sử events',
             'GET /history?limit=N': 'Lấy N events gần nhất',
@@ -35,61 +88,88 @@ def index():
 
 @app.route('/status', methods=['GET'])
 def get_status():
-    global service
+    svc = service
+    if svc is None or not svc.is_running:
+        return jsonify({
+            'running': False,
+            'message': 'Service is not running'
+        }), 503
     
-    with service_lock:
-        if service is None or not service.is_running:
-            return jsonify({
-                'running': False,
-                'message': 'Service is not running'
-            }), 503
-        
-        state = service.get_current_state()
-        
+    return _json_response(_status_body(svc))
+
+
+@app.route('/status/stream', methods=['GET'])
+def stream_status():
+    svc = service
+    if svc is None or not svc.is_running:
         return jsonify({
-            'running': True,
-            'state': state
-        })
+            'running': False,
+            'message': 'Service is not running'
+        }), 503
+    if not _sse_slots.acquire(blocking=False):
+        return jsonify({
+            'error': f'Too many status streams (max {MAX_SSE_STREAMS})'
+        }), 503
+    
+    def events():
+        # Chỉ gửi khi state đổi (chờ trên Condition của service, không polling)
+        version = svc.state_version
+        yield b'data: ' + _status_body(svc) + b'\n\n'
+        while svc.is_running:
+            if svc.wait_state_change(version, SSE_KEEPALIVE_SEC) == version:
+                if svc.is_running:
+                    yield b': ping\n\n'
+                continue
+            version = svc.state_version
+            yield b'data: ' + _status_body(svc) + b'\n\n'
+    
+    response = app.response_class(events(), mimetype='text/event-stream',
+                                  headers={'Cache-Control': 'no-cache'})
+    # server gọi close() khi kết thúc response (kể cả client ngắt) -> trả slot
+    response.call_on_close(_sse_slots.release)
+    return response
 
 
 @app.route('/statistics', methods=['GET'])
 def get_statistics():
-    global service
-    
-    with service_lock:
-        if service is None:
-            return jsonify({
-                'error': 'Service not initialized'
-            }), 503
-        
-        stats = service.get_statistics()
-        
+    svc = service
+    if svc is None:
         return jsonify({
-            'running': service.is_running,
-            'statistics': stats
-        })
+            'error': 'Service not initialized'
+        }), 503
+    
+    stats = svc.get_statistics()
+    
+    return jsonify({
+        'running': svc.is_running,
+        'statistics': stats
+    })
 
 
 @app.route('/history', methods=['GET'])
 def get_history():
-    global service
-    
-    with service_lock:
-        if service is None:
-            return jsonify({
-                'error': 'Service not initialized'
-            }), 503
-        
-        limit = request.args.get('limit', default=50, type=int)
-        limit = max(1, min(limit, 1000))
-        
-        history = service.get_history(limit=limit)
-        
+    svc = service
+    if svc is None:
         return jsonify({
+            'error': 'Service not initialized'
+        }), 503
+    
+    limit = request.args.get('limit', default=50, type=int)
+    limit = max(1, min(limit, 1000))
+    
+    global _history_cache
+    key = (svc.instance_id, svc.history_count, limit)
+    cached_key, body = _history_cache
+    if cached_key != key:
+        history = svc.get_history(limit=limit)
+        body = _dumps({
             'count': len(history),
             'limit': limit,
             'events': history
         })
+        _history_cache = (key, body)
+    
+    return _json_response(body)
 
 
 @app.route('/start', methods=['POST'])
@@ -151,119 +231,111 @@ def stop_service():
 
 @app.route('/led/brightness', methods=['POST'])
 def set_led_brightness():
-    global service
+    svc = service
+    if svc is None or not svc.is_running:
+        return jsonify({
+            'success': False,
+            'message': 'Service is not running'
+        }), 503
     
-    with service_lock:
-        if service is None or not service.is_running:
-            return jsonify({
-                'success': False,
-                'message': 'Service is not running'
-            }), 503
-        
-        if not service.enable_led or service.led_visualizer is None:
-            return jsonify({
-                'success': False,
-                'message': 'LED visualization is not enabled'
-            }), 400
-        
-        data = request.get_json()
-        if not data or 'brightness' not in data:
-            return jsonify({
-                'success': False,
-                'message': 'Missing brightness parameter'
-            }), 400
-        
-        brightness = data['brightness']
-        
-        if not isinstance(brightness, int) or brightness < 0 or brightness > 100:
-            return jsonify({
-                'success': False,
-                'message': 'Brightness must be an integer between 0 and 100'
-            }), 400
-        
-        service.led_visualizer.set_brightness(brightness)
-        
+    if getattr(svc, 'led_visualizer', None) is None:
         return jsonify({
-            'success': True,
-            'brightness': brightness
-        })
+            'success': False,
+            'message': 'LED visualization is not enabled'
+        }), 400
+    
+    data = request.get_json()
+    if not data or 'brightness' not in data:
+        return jsonify({
+            'success': False,
+            'message': 'Missing brightness parameter'
+        }), 400
+    
+    brightness = data['brightness']
+    
+    if not isinstance(brightness, int) or brightness < 0 or brightness > 100:
+        return jsonify({
+            'success': False,
+            'message': 'Brightness must be an integer between 0 and 100'
+        }), 400
+    
+    svc.led_visualizer.set_brightness(brightness)
+    
+    return jsonify({
+        'success': True,
+        'brightness': brightness
+    })
 
 
 @app.route('/led/pattern', methods=['POST'])
 def set_led_pattern():
-    global service
+    svc = service
+    if svc is None or not svc.is_running:
+        return jsonify({
+            'success': False,
+            'message': 'Service is not running'
+        }), 503
     
-    with service_lock:
-        if service is None or not service.is_running:
-            return jsonify({
-                'success': False,
-                'message': 'Service is not running'
-            }), 503
-        
-        if not service.enable_led or service.led_visualizer is None:
-            return jsonify({
-                'success': False,
-                'message': 'LED visualization is not enabled'
-            }), 400
-        
-        data = request.get_json()
-        if not data or 'pattern' not in data:
-            return jsonify({
-                'success': False,
-                'message': 'Missing pattern parameter'
-            }), 400
-        
-        pattern = data['pattern']
-        
-        if pattern not in ['echo', 'google']:
-            return jsonify({
-                'success': False,
-                'message': 'Pattern must be "echo" or "google"'
-            }), 400
-        
-        service.led_visualizer.change_pattern(pattern)
-        
+    if getattr(svc, 'led_visualizer', None) is None:
         return jsonify({
-            'success': True,
-            'pattern': pattern
-        })
+            'success': False,
+            'message': 'LED visualization is not enabled'
+        }), 400
+    
+    data = request.get_json()
+    if not data or 'pattern' not in data:
+        return jsonify({
+            'success': False,
+            'message': 'Missing pattern parameter'
+        }), 400
+    
+    pattern = data['pattern']
+    
+    if pattern not in ['echo', 'google']:
+        return jsonify({
+            'success': False,
+            'message': 'Pattern must be "echo" or "google"'
+        }), 400
+    
+    svc.led_visualizer.change_pattern(pattern)
+    
+    return jsonify({
+        'success': True,
+        'pattern': pattern
+    })
 
 
 @app.route('/led/off', methods=['POST'])
 def turn_off_led():
-    global service
+    svc = service
+    if svc is None or not svc.is_running:
+        return jsonify({
+            'success': False,
+            'message': 'Service is not running'
+        }), 503
     
-    with service_lock:
-        if service is None or not service.is_running:
-            return jsonify({
-                'success': False,
-                'message': 'Service is not running'
-            }), 503
-        
-        if not service.enable_led or service.led_visualizer is None:
-            return jsonify({
-                'success': False,
-                'message': 'LED visualization is not enabled'
-            }), 400
-        
-        service.led_visualizer.off()
-        
+    if getattr(svc, 'led_visualizer', None) is None:
         return jsonify({
-            'success': True,
-            'message': 'LED turned off'
-        })
+            'success': False,
+            'message': 'LED visualization is not enabled'
+        }), 400
+    
+    svc.led_visualizer.off()
+    
+    return jsonify({
+        'success': True,
+        'message': 'LED turned off'
+    })
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    global service
-    
-    with service_lock:
-        return jsonify({
-            'healthy': True,
-            'service_running': service is not None and service.is_running if service else False,
-            'timestamp': time.time()
-        })
+    svc = service
+    return jsonify({
+        'healthy': True,
+        'service_running': svc is not None and svc.is_running,
+        'timestamp': time.time()
+    })
 
 
 def run_api(host='0.0.0.0', port=5000, debug=False, auto_start_service=True):
@@ -299,7 +371,11 @@ def run_api(host='0.0.0.0', port=5000, debug=False, auto_start_service=True):
         print("   Nhấn Ctrl+C để dừng")
         print("=" * 60)
         
-        app.run(host=host, port=port, debug=debug, use_reloader=False)
+        if serve is not None and not debug:
+            # WSGI production server: pool thread xử lý song song các request
+            serve(app, host=host, port=port, threads=API_THREADS)
+        else:
+            app.run(host=host, port=port, debug=debug, use_reloader=False, threaded=True)
         
     except KeyboardInterrupt:
         print("\n\nStopping API server...")
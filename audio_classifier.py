@@ -1,7 +1,10 @@
 import enum
+import math
 import time
+import wave
 from typing import Optional, Dict, Any, Tuple
 from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import sys
 import os
@@ -10,6 +13,15 @@ import numpy as np
 import pyaudio
 import librosa
 import tensorflow as tf
+from scipy import fft as sp_fft
+
+from features_numba import rms as chunk_rms, rms_zcr, i16_to_f32
+from ring_buffer import SPSCRing
+
+try:
+    import onnxruntime as ort
+except ImportError:  # onnxruntime là tùy chọn, thiếu thì dùng Keras
+    ort = None
 
 
 def get_resource_path(relative_path: str) -> str:
@@ -34,10 +46,25 @@ DEFAULT_FORMAT = pyaudio.paInt16
 ENV_DURATION_SEC = 5.0
 ENV_SAMPLES = int(DEFAULT_RATE * ENV_DURATION_SEC)
 
+# Log-mel giống lúc train: (TIME_STEPS, N_MELS)
+ENV_N_FFT = 1024
+ENV_HOP = 512
+ENV_N_MELS = 64
+ENV_TIME_STEPS = 128
+
 # lấy bao nhiêu giây cuối trong buffer để predict (segment ngắn hơn vẫn OK vì preprocess sẽ pad/cắt về 5s)
 ENV_WINDOW_DURATION_SEC = 2.0
 ENV_WINDOW_SAMPLES = int(DEFAULT_RATE * ENV_WINDOW_DURATION_SEC)
 
+# Số chunk tối đa chờ trong ring giữa callback PyAudio và thread xử lý (lũy thừa 2)
+FRAME_QUEUE_SIZE = 4
+
+# n_fft của STFT dùng cho spectral centroid/bandwidth (rule-based)
+FEAT_N_FFT = 512
+
+# Dưới ngưỡng RMS này là SILENCE (không cần tính ZCR/centroid)
+SILENCE_RMS_TH = 0.0015
+
 # Ngưỡng gọi model
 ENV_MIN_RMS = 0.005
 
@@ -58,6 +85,13 @@ ENV_SWITCH_STREAK = 2           # cần 2 lần liên tiếp để switch (chố
 ENV_MODEL_FILENAME = "audio_cnn_best.h5"
 ENV_MODEL_PATH = get_resource_path(ENV_MODEL_FILENAME)
 
+# Bản ONNX export từ model .h5 (tạo bằng export_onnx.py), dùng nếu có onnxruntime
+ENV_ONNX_FILENAME = "audio_cnn_best.onnx"
+ENV_ONNX_PATH = get_resource_path(ENV_ONNX_FILENAME)
+# Bản ONNX INT8 (dynamic quantization), dùng khi quantize=True
+ENV_ONNX_INT8_FILENAME = "audio_cnn_best.int8.onnx"
+ENV_ONNX_INT8_PATH = get_resource_path(ENV_ONNX_INT8_FILENAME)
+
 ENV_CLASSES = [
     "car_horn",
     "cat",
@@ -87,6 +121,10 @@ class SoundType(enum.Enum):
     MUSIC = "music"
     NOISE = "noise"
 
+    def __init__(self, value):
+        # index 0..N-1 theo thứ tự khai báo -> dùng trực tiếp làm chỉ số mảng đếm
+        self.index = len(type(self).__members__)
+
 
 # ============================================================
 #                   ENV SOUND MODEL
@@ -96,12 +134,100 @@ class EnvSoundModel:
     """
     Input: waveform (float32) -> log-mel (128,64,1) giống training Kaggle.
     Output: probs (num_classes,)
+
+    Backend ưu tiên ONNX Runtime (nếu có onnxruntime + file .onnx), ngược lại Keras.
+    quantize=True: dùng bản ONNX INT8 nếu có; nếu chạy Keras thì chuyển sang TFLite
+    dynamic-range INT8 (weights int8, input/output vẫn float32) để giảm băng thông
+    bộ nhớ và thời gian inference.
     """
 
-    def __init__(self, model_path: str = ENV_MODEL_PATH):
+    def __init__(
+        self,
+        model_path: str = ENV_MODEL_PATH,
+        quantize: bool = False,
+        onnx_path: str = ENV_ONNX_PATH,
+        onnx_int8_path: str = ENV_ONNX_INT8_PATH,
+    ):
+        self.classes = ENV_CLASSES
+        self.model = None
+        self._forward = None
+        self._interpreter = None
+        self._sess = None
+
+        # Window + mel filterbank tính 1 lần, cache cột mel theo vị trí frame
+        self._window = librosa.filters.get_window("hann", ENV_N_FFT, fftbins=True).astype(np.float32)
+        self._mel_fb_t = librosa.filters.mel(sr=DEFAULT_RATE, n_fft=ENV_N_FFT, n_mels=ENV_N_MELS).T
+        self._mel_cache: Dict[int, np.ndarray] = {}
+
+        if quantize and os.path.exists(onnx_int8_path):
+            onnx_path = onnx_int8_path
+
+        if ort is not None and os.path.exists(onnx_path):
+            try:
+                self._load_onnx_session(onnx_path)
+                print(f"[EnvSoundModel] Using ONNX Runtime model: {onnx_path}")
+                return
+            except Exception as e:
+                print(f"[EnvSoundModel] Không load được ONNX, fallback Keras: {e}")
+                self._sess = None
+
         print(f"[EnvSoundModel] Loading model from: {model_path}")
+        self._set_single_thread()
         self.model = tf.keras.models.load_model(model_path)
-        self.classes = ENV_CLASSES
+        self._forward = self._build_forward()
+
+        if quantize:
+            try:
+                self._load_int8_interpreter()
+                print("[EnvSoundModel] Using INT8 (TFLite dynamic-range) model")
+            except Exception as e:
+                print(f"[EnvSoundModel] INT8 quantization failed, fallback FP32: {e}")
+                self._interpreter = None
+
+    @staticmethod
+    def _set_single_thread():
+        """Batch 1, input nhỏ: 1 thread tránh overhead đồng bộ giữa các thread"""
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(1)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        except RuntimeError:
+            pass  # TF runtime đã khởi tạo trước đó, giữ cấu hình cũ
+
+    def _build_forward(self):
+        """
+        Trace forward 1 lần thành graph (XLA nếu được) thay cho model.predict():
+        bỏ overhead Python/predict loop mỗi lần gọi, XLA gộp conv-bn-relu.
+        """
+        spec = [tf.TensorSpec((1, ENV_TIME_STEPS, ENV_N_MELS, 1), tf.float32)]
+        dummy = np.zeros((1, ENV_TIME_STEPS, ENV_N_MELS, 1), dtype=np.float32)
+        for jit in (True, False):
+            forward = tf.function(
+                lambda x: self.model(x, training=False), input_signature=spec, jit_compile=jit
+            )
+            try:
+                forward(dummy)  # warm-up: compile ngay lúc load
+                return forward
+            except Exception as e:
+                print(f"[EnvSoundModel] tf.function(jit_compile={jit}) failed: {e}")
+        return None
+
+    def _load_int8_interpreter(self):
+        converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        interpreter = tf.lite.Interpreter(model_content=converter.convert())
+        interpreter.allocate_tensors()
+        self._in_index = interpreter.get_input_details()[0]["index"]
+        self._out_index = interpreter.get_output_details()[0]["index"]
+        self._interpreter = interpreter
+
+    def _load_onnx_session(self, onnx_path: str):
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        so.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+        self._sess = ort.InferenceSession(
+            onnx_path, sess_options=so, providers=["CPUExecutionProvider"]
+        )
+        self._sess_input = self._sess.get_inputs()[0].name
 
     def _fix_length_5s(self, y: np.ndarray) -> np.ndarray:
         if len(y) < ENV_SAMPLES:
@@ -114,20 +240,19 @@ class EnvSoundModel:
         S = librosa.feature.melspectrogram(
             y=y,
             sr=sr,
-            n_fft=1024,
-            hop_length=512,
-            n_mels=64,
+            n_fft=ENV_N_FFT,
+            hop_length=ENV_HOP,
+            n_mels=ENV_N_MELS,
         )
         S_db = librosa.power_to_db(S, ref=np.max)  # (64, time)
         return S_db.astype(np.float32)
 
     def _pad_or_truncate_time(self, mel: np.ndarray) -> np.ndarray:
-        TIME_STEPS = 128
         mel = mel.T  # (time, 64)
-        if mel.shape[0] < TIME_STEPS:
-            mel = np.pad(mel, ((0, TIME_STEPS - mel.shape[0]), (0, 0)))
+        if mel.shape[0] < ENV_TIME_STEPS:
+            mel = np.pad(mel, ((0, ENV_TIME_STEPS - mel.shape[0]), (0, 0)))
         else:
-            mel = mel[:TIME_STEPS, :]
+            mel = mel[:ENV_TIME_STEPS, :]
         return mel.astype(np.float32)
 
     def _normalize_minmax(self, mel: np.ndarray) -> np.ndarray:
@@ -145,9 +270,77 @@ class EnvSoundModel:
         x = mel[np.newaxis, ..., np.newaxis].astype(np.float32)  # (1,128,64,1)
         return x
 
+    def clear_mel_cache(self):
+        self._mel_cache = {}
+
+    def _logmel_window(self, segment: np.ndarray, start_pos: int) -> np.ndarray:
+        """
+        Log-mel (N_MELS, TIME_STEPS) giống _wav_to_logmel(_fix_length_5s(segment))
+        nhưng chỉ FFT các frame mới:
+        - frame nằm trọn trong dữ liệu thật được cache theo vị trí tuyệt đối
+          (start_pos + tâm frame), lần predict sau (hop) dùng lại
+        - frame dính phần pad zero (đầu/cuối segment) luôn tính lại
+        - frame nằm hoàn toàn trong phần pad zero của 5s => power = 0
+        """
+        L = min(len(segment), ENV_SAMPLES)
+        half = ENV_N_FFT // 2
+
+        padded = np.zeros(ENV_SAMPLES + ENV_N_FFT, dtype=np.float32)
+        padded[half:half + L] = segment[:L]
+        frames = np.lib.stride_tricks.sliding_window_view(padded, ENV_N_FFT)[::ENV_HOP]
+
+        n_active = min(ENV_TIME_STEPS, (L + half - 1) // ENV_HOP + 1)
+        mel = np.zeros((ENV_TIME_STEPS, ENV_N_MELS), dtype=np.float32)
+        cache: Dict[int, np.ndarray] = {}
+        missing = []
+        for t in range(n_active):
+            c = t * ENV_HOP
+            cacheable = c >= half and c + half <= L
+            col = self._mel_cache.get(start_pos + c) if cacheable else None
+            if col is None:
+                missing.append(t)
+            else:
+                mel[t] = col
+                cache[start_pos + c] = col
+
+        if missing:
+            # scipy.fft giữ float32 (numpy.fft luôn đổi sang float64) -> nhanh hơn nhiều khi gom nhiều frame
+            spec = sp_fft.rfft(frames[missing] * self._window, axis=-1)
+            cols = ((spec.real ** 2 + spec.imag ** 2) @ self._mel_fb_t).astype(np.float32)
+            for t, col in zip(missing, cols):
+                mel[t] = col
+                c = t * ENV_HOP
+                if c >= half and c + half <= L:
+                    cache[start_pos + c] = col
+
+        self._mel_cache = cache
+        return librosa.power_to_db(mel.T, ref=np.max).astype(np.float32)  # (64, time)
+
+    def predict_probs_window(self, segment: np.ndarray, start_pos: int) -> np.ndarray:
+        """
+        Như predict_probs (sr = DEFAULT_RATE) nhưng dùng log-mel incremental.
+        start_pos: vị trí của segment[0] trong dòng sample liên tục đã đưa vào buffer
+        """
+        mel = self._logmel_window(segment, start_pos)
+        mel = self._normalize_minmax(mel.T)  # (128, 64)
+        x = mel[np.newaxis, ..., np.newaxis]  # (1,128,64,1)
+        return self._infer(x)
+
     def predict_probs(self, y: np.ndarray, sr: int = DEFAULT_RATE) -> np.ndarray:
         x = self.preprocess_waveform(y, sr)
-        probs = self.model.predict(x, verbose=0)[0]
+        return self._infer(x)
+
+    def _infer(self, x: np.ndarray) -> np.ndarray:
+        if self._sess is not None:
+            probs = self._sess.run(None, {self._sess_input: x})[0][0]
+        elif self._interpreter is not None:
+            self._interpreter.set_tensor(self._in_index, x)
+            self._interpreter.invoke()
+            probs = self._interpreter.get_tensor(self._out_index)[0]
+        elif self._forward is not None:
+            probs = self._forward(x).numpy()[0]
+        else:
+            probs = self.model.predict(x, verbose=0)[0]
         return probs.astype(np.float32)
 
 
@@ -173,6 +366,7 @@ class AudioClassifier:
         chunk: int = DEFAULT_CHUNK,
         channels: int = DEFAULT_CHANNELS,
         input_device_index: Optional[int] = None,
+        quantize: bool = False,
     ):
         self.RATE = rate
         self.CHUNK = chunk
@@ -183,15 +377,44 @@ class AudioClassifier:
         self.p = pyaudio.PyAudio()
         self.stream: Optional[pyaudio.Stream] = None
         self.is_recording: bool = False
+        # Callback PyAudio copy frame int16 vào ring SPSC (không lock), read_audio_chunk() lấy ra (block)
+        self._frame_bytes = self.CHUNK * self.CHANNELS * 2
+        self.frame_ring = SPSCRing(FRAME_QUEUE_SIZE, (self.CHUNK * self.CHANNELS,), np.int16)
+        # số frame callback phải bỏ (ring đầy / sai độ dài) - chỉ callback tăng
+        self.frames_dropped = 0
+        # Buffer float32 dùng lại cho mỗi chunk đọc được (không cấp phát mới)
+        self._scale = np.float32(1.0 / 32768.0)
+        self._f32_buf = np.empty(FRAME_QUEUE_SIZE * self.CHUNK, dtype=np.float32)
+        # Window hann + trục tần số + buffer phổ cho centroid/bandwidth, tính/cấp phát 1 lần
+        # (float32: audio 16-bit, scipy.fft giữ float32 -> nửa băng thông, gấp đôi lane SIMD)
+        self._feat_window = librosa.filters.get_window("hann", FEAT_N_FFT, fftbins=True).astype(np.float32)
+        freqs = np.fft.rfftfreq(FEAT_N_FFT, d=1.0 / self.RATE)
+        self._feat_freqs = freqs.astype(np.float32)
+        self._feat_freqs_sq = (freqs ** 2).astype(np.float32)
+        self._feat_frame = np.empty(FEAT_N_FFT, dtype=np.float32)
+        self._feat_mag = np.empty(FEAT_N_FFT // 2 + 1, dtype=np.float32)
 
         self.env_model: Optional[EnvSoundModel] = None
         try:
-            self.env_model = EnvSoundModel(ENV_MODEL_PATH)
+            self.env_model = EnvSoundModel(ENV_MODEL_PATH, quantize=quantize)
         except Exception as e:
             print(f"[AudioClassifier] Không load được EnvSoundModel: {e}")
             self.env_model = None
 
-        self.env_buffer = np.zeros(0, dtype=np.float32)
+        # Inference env model chạy trên 1 worker riêng, classify_chunk() không bị block.
+        # Worker tạo lúc submit đầu tiên, stop() tắt đi (không để lại thread sau mỗi lần dừng)
+        self._env_exec: Optional[ThreadPoolExecutor] = None
+        self._env_future: Optional[Future] = None
+        # tăng mỗi lần reset -> bỏ kết quả của inference gửi đi trước reset
+        self._env_gen = 0
+
+        # Buffer env cấp phát 1 lần (2 x ENV_SAMPLES): ghi nối tiếp vào _env_store,
+        # đầy thì dời ENV_SAMPLES sample mới nhất về đầu -> không concatenate mỗi chunk
+        self._env_store = np.empty(2 * ENV_SAMPLES, dtype=np.float32)
+        self._env_start = 0
+        self._env_end = 0
+        # tổng số sample đã đưa vào env_buffer (vị trí tuyệt đối cho cache log-mel)
+        self._env_pos = 0
         self.env_prob_hist = deque(maxlen=ENV_SMOOTH_K)
         self._last_env_pred_ts = 0.0
 
@@ -206,20 +429,36 @@ class AudioClassifier:
 
     # ---------------------------- STREAM ----------------------------
 
-    def start(self):
+    def _cb(self, in_data, frame_count, time_info, status):
+        """PyAudio callback: copy chunk vào ring, không xử lý gì ở đây"""
+        # ring đầy (consumer chậm) hoặc frame lẻ độ dài -> bỏ chunk
+        # (bỏ frame mới: chỉ consumer được sửa vị trí đọc của ring SPSC; consumer
+        # đọc bằng read_audio_window thì gom hết backlog nên không bị trễ dồn)
+        if len(in_data) != self._frame_bytes or not self.frame_ring.write_bytes(in_data):
+            self.frames_dropped += 1
+        return None, pyaudio.paContinue
+
+    def start(self) -> bool:
         if self.stream is not None:
-            return
+            return True
         print("[AudioClassifier] Opening audio input stream...")
-        self.stream = self.p.open(
-            format=self.FORMAT,
-            channels=self.CHANNELS,
-            rate=self.RATE,
-            input=True,
-            frames_per_buffer=self.CHUNK,
-            input_device_index=self.input_device_index,
-        )
+        self.frame_ring.clear()
+        try:
+            self.stream = self.p.open(
+                format=self.FORMAT,
+                channels=self.CHANNELS,
+                rate=self.RATE,
+                input=True,
+                frames_per_buffer=self.CHUNK,
+                input_device_index=self.input_device_index,
+                stream_callback=self._cb,
+            )
+        except Exception as e:
+            print(f"[AudioClassifier] Error opening stream: {e}")
+            return False
         self.is_recording = True
         print("[AudioClassifier] Stream started.")
+        return True
 
     def stop(self):
         if self.stream is not None:
@@ -232,12 +471,17 @@ class AudioClassifier:
             self.p.terminate()
             self.p = None
 
+        if self._env_exec is not None:
+            self._env_exec.shutdown(wait=False)
+            self._env_exec = None
+        self._env_future = None
+
         self.is_recording = False
         print("[AudioClassifier] Stopped.")
 
     # alias tương thích code cũ
-    def start_stream(self):
-        self.start()
+    def start_stream(self) -> bool:
+        return self.start()
 
     def stop_stream(self):
         self.stop()
@@ -247,50 +491,143 @@ class AudioClassifier:
 
     # ------------------------- READ AUDIO ----------------------------
 
-    def read_audio_chunk(self) -> Optional[np.ndarray]:
-        """Đọc chunk -> float32 [-1,1]"""
+    def read_audio_chunk(self, timeout: float = 0.5) -> Optional[np.ndarray]:
+        """
+        Chờ chunk kế tiếp từ callback -> float32 [-1,1] (None nếu timeout)
+        Lưu ý: trả về buffer dùng lại, lần đọc sau sẽ ghi đè - cần giữ thì .copy()
+        """
         if not self.stream or not self.is_recording:
             return None
+        frame = self.frame_ring.peek(timeout)
+        if frame is None:
+            return None
         try:
-            data = self.stream.read(self.CHUNK, exception_on_overflow=False)
-            audio_data = np.frombuffer(data, dtype=np.int16)
+            n = self._frame_to_f32(frame, 0)
+            return self._f32_buf[:n]
+        except Exception as e:
+            print(f"[AudioClassifier] Error reading audio: {e}")
+            return None
+        finally:
+            self.frame_ring.advance()
 
-            # lấy kênh 0
-            audio_channel_0 = audio_data[0::self.CHANNELS].astype(np.float32)
-            audio_channel_0 /= 32768.0
-            return audio_channel_0
+    def read_audio_window(self, timeout: float = 0.5) -> Optional[np.ndarray]:
+        """
+        Như read_audio_chunk nhưng gom mọi frame đang chờ trong ring (tối đa
+        FRAME_QUEUE_SIZE) thành 1 cửa sổ liên tục -> khi consumer bị trễ chỉ
+        classify 1 lần cho cả cụm thay vì N lần. Cũng trả về buffer dùng lại.
+        """
+        if not self.stream or not self.is_recording:
+            return None
+        ring = self.frame_ring
+        frame = ring.peek(timeout)
+        if frame is None:
+            return None
+        try:
+            n = 0
+            for _ in range(FRAME_QUEUE_SIZE):
+                n += self._frame_to_f32(frame, n)
+                ring.advance()
+                frame = ring.peek(0)
+                if frame is None:
+                    break
+            return self._f32_buf[:n]
         except Exception as e:
             print(f"[AudioClassifier] Error reading audio: {e}")
+            ring.advance()
             return None
 
+    def _frame_to_f32(self, frame: np.ndarray, offset: int) -> int:
+        """Kênh 0 của 1 frame int16 -> _f32_buf[offset:] (nhân 1/32768). Trả về số sample"""
+        audio_channel_0 = frame[0::self.CHANNELS]
+        n = audio_channel_0.size
+        if offset + n > self._f32_buf.size:
+            buf = np.empty(max(offset + n, FRAME_QUEUE_SIZE * self.CHUNK), dtype=np.float32)
+            buf[:offset] = self._f32_buf[:offset]
+            self._f32_buf = buf
+        i16_to_f32(audio_channel_0, self._scale, self._f32_buf[offset:offset + n])
+        return n
+
+    def record_to_file(self, filename: str, duration: float) -> bool:
+        """
+        Ghi kênh 0 (int16 mono) ra file WAV trong duration giây.
+        Ghi dần từng frame lấy từ ring (không gom cả bản ghi trong RAM rồi join)
+        """
+        started_here = self.stream is None
+        if not self.start():
+            return False
+
+        ring = self.frame_ring
+        ring.clear()
+        remaining = int(duration * self.RATE)
+        out_buf = np.empty(self.CHUNK, dtype=np.int16)
+        written = 0
+        try:
+            with wave.open(filename, 'wb') as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(self.p.get_sample_size(self.FORMAT))
+                wf.setframerate(self.RATE)
+                while remaining > 0:
+                    frame = ring.peek(1.0)
+                    if frame is None:
+                        print("[AudioClassifier] Stream không có dữ liệu, dừng ghi.")
+                        break
+                    ch0 = frame[0::self.CHANNELS][:remaining]
+                    out = out_buf[:ch0.size]
+                    np.copyto(out, ch0)
+                    ring.advance()
+                    wf.writeframesraw(out)
+                    remaining -= out.size
+                    written += out.size
+        finally:
+            if started_here:
+                self.stop()
+        return written > 0
+
     # ------------------------- FEATURES ------------------------------
 
-    def extract_features(self, chunk: np.ndarray) -> Dict[str, float]:
+    def extract_features(self, chunk: np.ndarray, rms: Optional[float] = None) -> Dict[str, float]:
+        """rms: truyền vào nếu đã tính sẵn (vd. từ AudioProcessor.process_fused)"""
         features: Dict[str, float] = {}
-        rms = float(np.sqrt(np.mean(chunk ** 2) + 1e-9))
-        features["rms"] = rms
-
-        zcr = librosa.feature.zero_crossing_rate(
-            chunk, frame_length=len(chunk), hop_length=len(chunk)
-        )[0, 0]
+        # RMS + ZCR gộp 1 lượt duyệt (FFT cho centroid/bandwidth tính riêng)
+        chunk_rms_val, zcr = rms_zcr(chunk)
+        if rms is None:
+            rms = chunk_rms_val
+        features["rms"] = float(rms)
         features["zcr"] = float(zcr)
 
-        S = np.abs(librosa.stft(chunk, n_fft=512, hop_length=max(1, len(chunk)//2), center=False))
-        centroid = librosa.feature.spectral_centroid(S=S, sr=self.RATE)[0, 0]
-        bandwidth = librosa.feature.spectral_bandwidth(S=S, sr=self.RATE)[0, 0]
-        features["centroid"] = float(centroid)
-        features["bandwidth"] = float(bandwidth)
+        centroid, bandwidth = self._centroid_bandwidth(chunk)
+        features["centroid"] = centroid
+        features["bandwidth"] = bandwidth
         return features
 
+    def _centroid_bandwidth(self, chunk: np.ndarray) -> Tuple[float, float]:
+        """
+        Spectral centroid + bandwidth của frame STFT đầu tiên (n_fft=512, hann,
+        center=False) - giống librosa nhưng window/tần số tính sẵn, 1 lần rfft
+        """
+        n = min(len(chunk), FEAT_N_FFT)
+        frame = self._feat_frame
+        np.multiply(chunk[:n], self._feat_window[:n], out=frame[:n])
+        frame[n:] = 0.0
+        mag = np.abs(sp_fft.rfft(frame, overwrite_x=True), out=self._feat_mag)
+        total = mag.sum()
+        if total <= 0.0:
+            return 0.0, 0.0
+        mag /= total
+        centroid = float(np.dot(self._feat_freqs, mag))
+        # sum((f - c)^2 * p) = sum(f^2 * p) - c^2 (sum p = 1): 2 lệnh dot, không mảng tạm
+        var = float(np.dot(self._feat_freqs_sq, mag)) - centroid * centroid
+        bandwidth = math.sqrt(var) if var > 0.0 else 0.0
+        return centroid, bandwidth
+
     # -------------------- RULE-BASED CLASSIFIER --------------------
 
-    def classify_sound(self, chunk: np.ndarray) -> SoundType:
-        feats = self.extract_features(chunk)
-        rms = feats["rms"]
-        zcr = feats["zcr"]
-        centroid = feats["centroid"]
+    def classify_sound(self, features: Dict[str, float]) -> SoundType:
+        """features: kết quả extract_features() của chunk (không tính lại FFT/RMS/ZCR)"""
+        rms = features["rms"]
+        zcr = features["zcr"]
+        centroid = features["centroid"]
 
-        SILENCE_RMS_TH = 0.0015
         SPEECH_RMS_MIN = 0.0015
         SPEECH_RMS_MAX = 0.02
 
@@ -312,8 +649,19 @@ class AudioClassifier:
 
     # ------------------ ENV MODEL + SMOOTHING -----------------------
 
+    @property
+    def env_buffer(self) -> np.ndarray:
+        """View (tối đa ENV_SAMPLES sample gần nhất) vào buffer env"""
+        return self._env_store[self._env_start:self._env_end]
+
     def _reset_env_state(self):
-        self.env_buffer = np.zeros(0, dtype=np.float32)
+        self._env_start = self._env_end = 0
+        # _env_pos giữ tăng dần (không về 0): worker đang chạy có thể ghi lại cache
+        # log-mel cũ, vị trí mới luôn lớn hơn nên không bao giờ trùng key cũ
+        if self.env_model is not None:
+            self.env_model.clear_mel_cache()
+        self._env_gen += 1
+        self._env_future = None
         self.env_prob_hist.clear()
         self._switch_streak = 0
         self._last_raw_top = None
@@ -321,19 +669,30 @@ class AudioClassifier:
         self._last_env_conf = 0.0
 
     def _append_env_buffer(self, chunk: np.ndarray):
-        if self.env_buffer.size == 0:
-            self.env_buffer = chunk
-        else:
-            self.env_buffer = np.concatenate([self.env_buffer, chunk])
+        n = chunk.size
+        self._env_pos += n
+        store = self._env_store
+        if n >= ENV_SAMPLES:
+            store[:ENV_SAMPLES] = chunk[-ENV_SAMPLES:]
+            self._env_start, self._env_end = 0, ENV_SAMPLES
+            return
 
-        if self.env_buffer.size > ENV_SAMPLES:
-            self.env_buffer = self.env_buffer[-ENV_SAMPLES:]
+        end = self._env_end
+        if end + n > store.size:
+            # hết chỗ: dời phần còn giữ lại về đầu (mỗi ~ENV_SAMPLES sample mới 1 lần)
+            keep = min(end - self._env_start, ENV_SAMPLES - n)
+            store[:keep] = store[end - keep:end]
+            self._env_start, end = 0, keep
+        store[end:end + n] = chunk
+        end += n
+        self._env_end = end
+        self._env_start = max(self._env_start, end - ENV_SAMPLES)
 
     def _update_env_buffer_and_predict(self, chunk: np.ndarray) -> Tuple[Optional[str], float, bool]:
         """
         Returns: (label, conf, updated)
-        - updated=True nếu vừa predict mới theo hop
-        - updated=False nếu chưa đến hop (giữ kết quả cũ)
+        - updated=True nếu vừa nhận kết quả predict mới từ worker
+        - updated=False nếu chưa đến hop / inference còn đang chạy (giữ kết quả cũ)
         """
         if self.env_model is None:
             return None, 0.0, False
@@ -343,6 +702,17 @@ class AudioClassifier:
         if self.env_buffer.size < ENV_WINDOW_SAMPLES:
             return None, 0.0, False
 
+        # Kết quả inference trước đã xong -> lấy về (không block)
+        fut = self._env_future
+        if fut is not None:
+            if not fut.done():
+                return self._last_env_label, self._last_env_conf, False
+            self._env_future = None
+            gen, probs = fut.result()
+            if gen == self._env_gen:
+                label, conf = self._apply_env_probs(probs)
+                return label, conf, True
+
         now = time.time()
         if (now - self._last_env_pred_ts) < ENV_PRED_HOP_SEC:
             # chưa đến hop
@@ -350,9 +720,26 @@ class AudioClassifier:
 
         self._last_env_pred_ts = now
 
-        segment = self.env_buffer[-ENV_WINDOW_SAMPLES:]
-        probs = self.env_model.predict_probs(segment, sr=self.RATE)  # (C,)
+        # _env_store bị ghi đè khi dời về đầu -> worker cần bản copy riêng (1 lần mỗi hop)
+        segment = self.env_buffer[-ENV_WINDOW_SAMPLES:].copy()
+        if self._env_exec is None:
+            self._env_exec = ThreadPoolExecutor(max_workers=1, thread_name_prefix="env-infer")
+        self._env_future = self._env_exec.submit(
+            self._predict_env, segment, self._env_pos - segment.size, self._env_gen
+        )
+        return self._last_env_label, self._last_env_conf, False
+
+    def _predict_env(self, segment: np.ndarray, start_pos: int, gen: int) -> Tuple[int, np.ndarray]:
+        """Chạy trên worker env-infer: segment -> probs (C,)"""
+        if self.RATE == DEFAULT_RATE:
+            # log-mel incremental: chỉ FFT các frame mới kể từ lần predict trước
+            probs = self.env_model.predict_probs_window(segment, start_pos)
+        else:
+            probs = self.env_model.predict_probs(segment, sr=self.RATE)  # (C,)
+        return gen, probs
 
+    def _apply_env_probs(self, probs: np.ndarray) -> Tuple[str, float]:
+        """Fast switch + smoothing trên probs vừa predict, cập nhật label gần nhất"""
         # ===== Fast switch logic (dựa trên raw probs) =====
         raw_top = int(np.argmax(probs))
         raw_conf = float(probs[raw_top])
@@ -382,13 +769,14 @@ class AudioClassifier:
 
         self._last_env_label = label
         self._last_env_conf = conf
-        return label, conf, True
+        return label, conf
 
     # ---------------------- PUBLIC API ------------------------------
 
-    def classify_chunk(self, chunk: np.ndarray) -> Tuple[SoundType, Dict[str, Any]]:
+    def classify_chunk(self, chunk: np.ndarray, rms: Optional[float] = None) -> Tuple[SoundType, Dict[str, Any]]:
         """
         Dùng cho pipeline/GUI: 
+        - rms: RMS đã tính sẵn của chunk (không tính lại)
         - sound_type (rule-based)
         - features có env_label/env_conf
           * env_label sẽ giữ kết quả gần nhất giữa các hop
@@ -398,8 +786,16 @@ class AudioClassifier:
         if chunk is None or len(chunk) == 0:
             return SoundType.UNKNOWN, {}
 
-        features = self.extract_features(chunk)
-        sound_type = self.classify_sound(chunk)
+        if rms is None:
+            rms = chunk_rms(chunk)
+
+        if rms < SILENCE_RMS_TH:
+            # Im lặng: bỏ qua ZCR/STFT, features còn lại = 0
+            features = {"rms": float(rms), "zcr": 0.0, "centroid": 0.0, "bandwidth": 0.0}
+            sound_type = SoundType.SILENCE
+        else:
+            features = self.extract_features(chunk, rms=rms)
+            sound_type = self.classify_sound(features)
         rms = float(features.get("rms", 0.0))
 
         # ===== Auto reset when silence/low energy =====
@@ -5,6 +5,8 @@ Kiểm soát AGC để không phóng đại tiếng ồn nền.
 import numpy as np
 from scipy import signal
 
+from features_numba import rms, gain_clip_rms
+
 class AudioProcessor:
     def __init__(self, rate=16000, chunk_size=1024):
         self.rate = rate
@@ -68,8 +70,14 @@ class AudioProcessor:
         if not self.agc_enabled:
             return chunk
 
-        chunk_rms = np.sqrt(np.mean(chunk**2) + 1e-9)
-        
+        chunk_rms = rms(chunk)
+        self._update_gain(chunk_rms)
+        processed = chunk * self.current_gain
+        processed = np.clip(processed, -1.0, 1.0)
+        return processed
+
+    def _update_gain(self, chunk_rms: float) -> float:
+        """Cập nhật current_gain (smoothing) theo RMS của chunk"""
         if chunk_rms < self.gate_threshold:
             # Vùng Silence: Giữ 10% volume (giảm ồn nền)
             target_gain = self.gate_ratio
@@ -86,9 +94,7 @@ class AudioProcessor:
             smoothing = self.agc_smooth
 
         self.current_gain = (self.current_gain * (1 - smoothing)) + (target_gain * smoothing)
-        processed = chunk * self.current_gain
-        processed = np.clip(processed, -1.0, 1.0)
-        return processed
+        return self.current_gain
 
     def process(self, chunk: np.ndarray) -> np.ndarray:
         if len(chunk) == 0: return chunk
@@ -99,6 +105,24 @@ class AudioProcessor:
         
         return normalized
 
+    def process_fused(self, chunk: np.ndarray):
+        """
+        Giống process() nhưng AGC gain + clip + RMS đầu ra gộp trong 1 lượt duyệt.
+        Returns: (processed, rms của processed)
+        """
+        if len(chunk) == 0: return chunk, 0.0
+
+        filtered = self.apply_bandpass(chunk)
+        spectral_clean = self.apply_spectral_gate(filtered)
+
+        if not self.agc_enabled:
+            return spectral_clean, rms(spectral_clean)
+
+        gain = self._update_gain(rms(spectral_clean))
+        normalized = np.empty_like(spectral_clean)
+        rms_out = gain_clip_rms(spectral_clean, gain, normalized)
+        return normalized, rms_out
+
     def reset_states(self):
         self.sos_state = signal.sosfilt_zi(self.sos)
         self.current_gain = 1.0
\ No newline at end of file
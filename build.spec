@@ -15,6 +15,9 @@ my_hidden_imports = [
     'sound_detector',
     'audio_classifier',
     'audio_processor',
+    'features_numba',
+    '_features_aot',  # kernel AOT (build_features_aot.py), không có thì bỏ qua
+    'ring_buffer',
     'config',
     'queue',
     'threading',
@@ -0,0 +1,31 @@
+"""
+build_features_aot.py
+Biên dịch trước (AOT, numba.pycc) các kernel mỗi chunk/tick trong features_numba
+thành module _features_aot -> không tốn thời gian JIT lúc khởi động.
+
+Chạy 1 lần trên máy đích (hoặc trước khi pyinstaller build.spec):
+    python build_features_aot.py
+File _features_aot.*.so / .pyd được đặt cạnh features_numba.py, có thì tự dùng.
+"""
+
+import os
+
+from numba.pycc import CC
+
+from features_numba import _rms_zcr_kernel, _count_event_kernel
+
+
+def build():
+    cc = CC('_features_aot')
+    cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+    cc.verbose = True
+
+    cc.export('rms_zcr_f4', 'UniTuple(f8, 2)(f4[:])')(_rms_zcr_kernel)
+    cc.export('rms_zcr_f8', 'UniTuple(f8, 2)(f8[:])')(_rms_zcr_kernel)
+    cc.export('count_event', 'void(i8[:], i8, i8[:], i8)')(_count_event_kernel)
+
+    cc.compile()
+
+
+if __name__ == '__main__':
+    build()
@@ -3,24 +3,41 @@
 import sys
 import argparse
 import time
-from datetime import datetime
 
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
-from rich.live import Live
-from rich.layout import Layout
 from rich.text import Text
 from rich import box
-from rich.progress import Progress, SpinnerColumn, TextColumn
 
 from sound_detector import SoundDetector
-from audio_classifier import AudioClassifier, SoundType
-from sound_service import SoundDetectionService
 import config
 
+# rich.progress và audio_classifier / sound_service (kéo theo tensorflow, librosa)
+# chỉ import trong lệnh cần dùng -> status / test-vad khởi động nhanh
+
 console = Console()
 
+# Màu theo sound type (key = SoundType.value), dựng 1 lần thay vì mỗi dòng in
+TYPE_COLORS = {
+    'speech': 'green',
+    'music': 'blue',
+    'noise': 'red',
+    'silence': 'dim',
+    'unknown': 'yellow'
+}
+# Bảng thống kê: silence in trắng thay vì dim
+STATS_COLORS = {**TYPE_COLORS, 'silence': 'white'}
+# Markup Rich dựng sẵn cho cột sound type (monitor: rộng 12, test-audio: rộng 10)
+MONITOR_TYPE_MARKUP = {t: f"[{c}]{t.upper():12}[/{c}]" for t, c in TYPE_COLORS.items()}
+TEST_TYPE_MARKUP = {t: f"[{c}]{t.upper():10}[/{c}]" for t, c in TYPE_COLORS.items()}
+# Cột VAD của monitor, chọn theo bool
+VAD_STR = ("No ", "Yes")
+# Thanh % dựng sẵn: BARS[k] = k ký tự █ (100% / 3 -> tối đa 33)
+BARS = tuple("█" * i for i in range(34))
+
+# test-vad / test-audio: chu kỳ đọc / in kết quả (ns, đếm bằng time.monotonic_ns)
+TEST_INTERVAL_NS = 500_000_000
 
 def print_header(text, style="bold cyan"):
     console.print(Panel(f"[{style}]{text}[/{style}]", box=box.DOUBLE))
@@ -41,6 +58,10 @@ def print_info(text):
 def cmd_start(args):
     print_header("Starting Sound Detection Service")
     
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+    from sound_service import SoundDetectionService
+    
+    service = None
     try:
         service = SoundDetectionService(
             enable_audio_classification=not args.no_classifier
@@ -67,7 +88,7 @@ def cmd_start(args):
             
     except KeyboardInterrupt:
         console.print("\n[yellow]Stopping service...[/yellow]")
-        if 'service' in locals():
+        if service is not None:
             try:
                 service.stop()
             except:
@@ -75,7 +96,7 @@ def cmd_start(args):
         print_success("Service stopped")
     except Exception as e:
         print_error(f"Failed to start service: {e}")
-        if 'service' in locals():
+        if service is not None:
             try:
                 service.stop()
             except:
@@ -90,30 +111,40 @@ def monitor_service_live(service):
     console.print("[bold]VAD | Volume (RMS) | Direction | Sound Type[/bold]")
     console.print("[bold cyan]═══════════════════════════════════════════════════[/bold cyan]")
     
+    # Dirty flag: chỉ đọc state khi state_version đổi, chỉ in khi dòng hiển thị khác dòng trước
+    # (service im lặng -> mỗi tick chỉ là 1 lần chờ Condition, không dựng/in lại)
+    version = None
+    last_line = None
+    # Nhịp refresh bù trôi: tick kế = tick trước + interval (không phải "xong việc rồi ngủ đủ interval")
+    interval = config.MONITOR_REFRESH_RATE
+    next_tick = time.monotonic()
+    
     try:
         while True:
-            status = service.get_current_state()
-            
-            vad = "Yes" if status.get('vad') else "No "
-            
-            rms = status.get('rms', 0)
+            new_version = service.wait_state_change(version, config.MONITOR_REFRESH_RATE)
+            if new_version == version:
+                if not service.is_running:
+                    # service đã dừng: wait_state_change trả về ngay, tránh quay vòng bận
+                    time.sleep(config.MONITOR_REFRESH_RATE)
+                continue
+            version = new_version
+            # Đọc thẳng namedtuple State (get_current_state() dựng dict + format ISO timestamp mỗi lần)
+            state = service.current_state
             
-            dir_val = status.get('direction')
+            dir_val = state.direction
             direction = f"{dir_val:>3}°" if dir_val is not None else " N/A"
             
-            sound_type = status.get('sound_type', 'unknown').upper()
+            line = f"{VAD_STR[bool(state.vad)]} | {state.rms:13.0f} | {direction:9} | {MONITOR_TYPE_MARKUP[state.sound_type.value]}"
+            if line != last_line:
+                console.print(line)
+                last_line = line
             
-            color = {
-                'SPEECH': 'green',
-                'MUSIC': 'blue',
-                'NOISE': 'red',
-                'SILENCE': 'dim',
-                'UNKNOWN': 'yellow'
-            }.get(sound_type, 'white')
-            
-            console.print(f"{vad:3} | {rms:13.0f} | {direction:9} | [{color}]{sound_type:12}[/{color}]")
-            
-            time.sleep(config.MONITOR_REFRESH_RATE)
+            next_tick += interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()  # trễ quá 1 tick (in chậm): đồng bộ lại
             
     except KeyboardInterrupt:
         console.print("\n[bold cyan]═══════════════════════════════════════════════════[/bold cyan]")
@@ -129,23 +160,19 @@ def monitor_service_live(service):
         table.add_column("Percentage", style="yellow", width=12, justify="right")
         table.add_column("Bar", style="blue", width=30)
         
-        for sound_type, count in stats.get('by_type', {}).items():
-            percentage = stats.get('percentages', {}).get(sound_type, 0)
-            bar = "█" * int(percentage / 3)
+        by_type = stats.get('by_type') or {}
+        percentages = stats.get('percentages') or {}
+        for sound_type, count in by_type.items():
+            percentage = percentages.get(sound_type, 0)
+            bar = BARS[min(33, int(percentage / 3))]
             
-            color = {
-                'speech': 'green',
-                'music': 'blue',
-                'noise': 'red',
-                'silence': 'white',
-                'unknown': 'yellow'
-            }.get(sound_type, 'white')
+            color = STATS_COLORS.get(sound_type, 'white')
             
             table.add_row(
-                f"[{color}]{sound_type.upper()}[/{color}]",
+                Text(sound_type.upper(), style=color),
                 str(count),
                 f"{percentage:.1f}%",
-                f"[{color}]{bar}[/{color}]"
+                Text(bar, style=color)
             )
         
         console.print(table)
@@ -194,34 +221,55 @@ def cmd_test_vad(args):
         console.print("[dim]Time     │ VAD    │ Speech │ Direction[/dim]")
         console.print("[dim]─────────┼────────┼────────┼──────────[/dim]")
         
-        start_time = time.time()
-        detections = []
-        
-        while time.time() - start_time < args.duration:
-            status = detector.get_status()
-            timestamp = time.strftime("%H:%M:%S")
-            
-            vad = "YES" if status['vad'] else "NO"
-            speech = "YES" if status['speech'] else "NO"
-            direction = f"{status['direction']}°" if status['direction'] else "N/A"
+        # deadline/tick số nguyên trên đồng hồ monotonic: không trôi theo NTP,
+        # tick sau tính từ tick trước (không cộng dồn thời gian xử lý)
+        now_ns = time.monotonic_ns()
+        deadline = now_ns + int(args.duration * 1e9)
+        next_tick = now_ns
+        # đếm dồn ngay trong vòng lặp thay vì giữ list status rồi duyệt lại
+        samples = vad_count = speech_count = 0
+        last_sec = None
+        last_row = None
+        
+        # XMOS chỉ đọc được bằng polling (không có ngắt báo thay đổi): mỗi tick đọc
+        # read_state() (3 transfer, bỏ AGC của get_status), chỉ in khi trạng thái đổi
+        while now_ns < deadline:
+            vad_on, speech_on, dir_val = state = detector.read_state()
+            samples += 1
+            vad_count += vad_on
+            speech_count += speech_on
             
-            vad_color = "red" if status['vad'] else "dim"
-            console.print(f"[dim]{timestamp}[/dim] │ [{vad_color}]{vad:^6}[/{vad_color}] │ {speech:^6} │ [green]{direction:>8}[/green]")
+            if state != last_row:
+                last_row = state
+                # chỉ format lại giờ khi sang giây mới
+                sec = int(time.time())
+                if sec != last_sec:
+                    last_sec = sec
+                    timestamp = time.strftime("%H:%M:%S", time.localtime(sec))
+                
+                vad = "YES" if vad_on else "NO"
+                speech = "YES" if speech_on else "NO"
+                direction = f"{dir_val}°" if dir_val else "N/A"
+                
+                vad_color = "red" if vad_on else "dim"
+                console.print(f"[dim]{timestamp}[/dim] │ [{vad_color}]{vad:^6}[/{vad_color}] │ {speech:^6} │ [green]{direction:>8}[/green]")
             
-            detections.append(status)
-            time.sleep(0.5)
+            next_tick += TEST_INTERVAL_NS
+            now_ns = time.monotonic_ns()
+            if next_tick > now_ns:
+                time.sleep((next_tick - now_ns) / 1e9)
+                now_ns = time.monotonic_ns()
         
         console.print("\n" + "─" * 50)
-        vad_count = sum(1 for d in detections if d['vad'])
-        speech_count = sum(1 for d in detections if d['speech'])
+        total = max(samples, 1)
         
         table = Table(show_header=False, box=box.SIMPLE, show_edge=False)
         table.add_column("Metric", style="cyan")
         table.add_column("Value", style="green")
         
-        table.add_row("Total samples", str(len(detections)))
-        table.add_row("VAD detections", f"{vad_count} ({vad_count/len(detections)*100:.1f}%)")
-        table.add_row("Speech detections", f"{speech_count} ({speech_count/len(detections)*100:.1f}%)")
+        table.add_row("Total samples", str(samples))
+        table.add_row("VAD detections", f"{vad_count} ({vad_count/total*100:.1f}%)")
+        table.add_row("Speech detections", f"{speech_count} ({speech_count/total*100:.1f}%)")
         
         console.print(table)
         detector.disconnect()
@@ -234,6 +282,7 @@ def cmd_test_vad(args):
 def cmd_test_audio(args):
     """Test audio classification"""
     print_header("Testing Audio Classification")
+    from audio_classifier import AudioClassifier, SoundType
     
     try:
         classifier = AudioClassifier()
@@ -255,32 +304,33 @@ def cmd_test_audio(args):
             console.print("[dim]Type       │ RMS    │ ZCR[/dim]")
             console.print("[dim]───────────┼────────┼──────────[/dim]")
         
-        sound_counts = {}
-        start_time = time.time()
+        # đếm theo SoundType.index (0..N-1): không hash enum/chuỗi trong vòng lặp
+        sound_counts = [0] * len(SoundType)
+        now_ns = time.monotonic_ns()
+        deadline = now_ns + int(args.duration * 1e9)
+        next_print = now_ns
         
-        while time.time() - start_time < args.duration:
+        # classify_audio chờ chunk kế tiếp từ stream -> classify mọi chunk (không sleep,
+        # không bỏ audio), chỉ in 1 dòng mỗi TEST_INTERVAL_NS
+        while now_ns < deadline:
             sound_type, features = classifier.classify_audio()
-            sound_counts[sound_type.value] = sound_counts.get(sound_type.value, 0) + 1
+            sound_counts[sound_type.index] += 1
+            
+            now_ns = time.monotonic_ns()
+            if now_ns < next_print:
+                continue
+            next_print = now_ns + TEST_INTERVAL_NS
             
             direction = None
             if detector_available:
                 direction = detector.get_direction()
             
-            color_map = {
-                'silence': 'dim',
-                'speech': 'green',
-                'music': 'blue',
-                'noise': 'red',
-                'unknown': 'yellow'
-            }
-            color = color_map.get(sound_type.value, 'white')
+            markup = TEST_TYPE_MARKUP[sound_type.value]
             
             if detector_available and direction is not None:
-                console.print(f"[{color}]{sound_type.value.upper():10}[/{color}] │ {features.get('rms', 0):6.0f} │ {features.get('zcr', 0):.6f} │ [green]{direction:>3}°[/green]")
+                console.print(f"{markup} │ {features.get('rms', 0):6.0f} │ {features.get('zcr', 0):.6f} │ [green]{direction:>3}°[/green]")
             else:
-                console.print(f"[{color}]{sound_type.value.upper():10}[/{color}] │ {features.get('rms', 0):6.0f} │ {features.get('zcr', 0):.6f}")
-            
-            time.sleep(0.5)
+                console.print(f"{markup} │ {features.get('rms', 0):6.0f} │ {features.get('zcr', 0):.6f}")
         
         if detector_available:
             detector.disconnect()
@@ -295,23 +345,21 @@ def cmd_test_audio(args):
         table.add_column("Percentage", style="yellow", width=15)
         table.add_column("Bar", style="blue", width=30)
         
-        total = sum(sound_counts.values())
-        for sound_type, count in sorted(sound_counts.items(), key=lambda x: x[1], reverse=True):
-            percentage = (count / total * 100) if total > 0 else 0
-            bar = "█" * int(percentage / 3.33)
+        total = sum(sound_counts)
+        inv_total = (100.0 / total) if total > 0 else 0.0
+        counted = [(st.value, sound_counts[st.index]) for st in SoundType if sound_counts[st.index]]
+        counted.sort(key=lambda x: x[1], reverse=True)
+        for sound_type, count in counted:
+            percentage = count * inv_total
+            bar = BARS[min(33, int(percentage * 0.3))]  # ~ / 3.33
             
-            color = {
-                'speech': 'green',
-                'music': 'blue',
-                'noise': 'red',
-                'silence': 'white'
-            }.get(sound_type, 'white')
+            color = STATS_COLORS.get(sound_type, 'white')
             
             table.add_row(
-                f"[{color}]{sound_type.upper()}[/{color}]",
+                Text(sound_type.upper(), style=color),
                 str(count),
                 f"{percentage:.1f}%",
-                f"[{color}]{bar}[/{color}]"
+                Text(bar, style=color)
             )
         
         console.print(table)
@@ -325,15 +373,20 @@ def cmd_test_audio(args):
 def cmd_record(args):
     """Record audio to file"""
     print_header(f"Recording to {args.output}")
+    from rich.progress import Progress
+    from audio_classifier import AudioClassifier
     
     try:
         classifier = AudioClassifier()
         
         with Progress(console=console) as progress:
             task = progress.add_task("[cyan]Recording...", total=args.duration)
-            classifier.record_to_file(args.output, args.duration)
+            ok = classifier.record_to_file(args.output, args.duration)
             progress.update(task, completed=args.duration)
         
+        if not ok:
+            print_error(f"Recording failed: no audio captured to {args.output}")
+            sys.exit(1)
         print_success(f"Recorded {args.duration}s to {args.output}")
         
     except Exception as e:
@@ -341,8 +394,11 @@ def cmd_record(args):
         sys.exit(1)
 
 
-def main():
-    """Main CLI entry point"""
+# Lệnh không có tham số nào: chạy thẳng, không cần dựng cây subparser của argparse
+FAST_COMMANDS = {'status'}
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="ReSpeaker Sound Detection Service - Modern CLI",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -374,11 +430,21 @@ Examples:
     record_parser.add_argument('output', help='Output WAV file')
     record_parser.add_argument('--duration', type=int, default=5, help='Duration in seconds')
     
-    args = parser.parse_args()
-    
-    if not args.command:
-        parser.print_help()
-        sys.exit(1)
+    return parser
+
+
+def main():
+    """Main CLI entry point"""
+    argv = sys.argv[1:]
+    if len(argv) == 1 and argv[0] in FAST_COMMANDS:
+        args = argparse.Namespace(command=argv[0])
+    else:
+        parser = build_parser()
+        args = parser.parse_args(argv)
+        
+        if not args.command:
+            parser.print_help()
+            sys.exit(1)
     
     commands = {
         'start': cmd_start,
@@ -11,6 +11,31 @@ import time
 from typing import Optional
 from audio_processor import AudioProcessor  # Import file xử lý âm thanh của bạn
 
+# Hằng số nghịch đảo để đổi int16 -> float32 bằng phép nhân thay vì phép chia
+_INV32768 = np.float32(1.0 / 32768.0)
+
+try:
+    from numba import njit
+except ImportError:  # numba là tùy chọn, thiếu thì dùng NumPy
+    njit = None
+
+
+if njit is not None:
+    @njit(cache=True, fastmath=True, boundscheck=False)
+    def _f2i_sat(src, dst):
+        """float [-1,1] -> int16 (clip + scale + cast trong 1 vòng lặp)"""
+        for i in range(src.shape[0]):
+            v = src[i] * 32767.0
+            if v < -32767.0:
+                v = -32767.0
+            elif v > 32767.0:
+                v = 32767.0
+            dst[i] = np.int16(v)
+else:
+    def _f2i_sat(src, dst):
+        """float [-1,1] -> int16 (bản NumPy khi không có numba)"""
+        dst[:] = np.clip(src, -1.0, 1.0) * 32767.0
+
 class DualAudioRecorder:
     def __init__(self, 
                  rate: int = 16000, 
@@ -31,15 +56,17 @@ class DualAudioRecorder:
         self.stream: Optional[pyaudio.Stream] = None
         self.processor = AudioProcessor(rate=rate, chunk_size=chunk)
         
-        # Buffer để chứa dữ liệu audio
-        self.frames_raw = []
-        self.frames_clean = []
+        # File WAV được ghi dần theo từng chunk (không giữ toàn bộ frames trong RAM)
+        self._wf_raw: Optional[wave.Wave_write] = None
+        self._wf_clean: Optional[wave.Wave_write] = None
+        # Buffer dùng lại mỗi chunk: float32 cho đầu vào Processor,
+        # int16 cho dữ liệu đã xử lý (tránh tobytes() mỗi chunk)
+        self._float_buf = np.zeros(chunk * channels, dtype=np.float32)
+        self._int_buf = np.zeros(chunk * channels, dtype=np.int16)
         self.is_recording = False
 
     def start_recording(self):
         """Bắt đầu stream ghi âm"""
-        self.frames_raw = []
-        self.frames_clean = []
         self.processor.reset_states() # Reset bộ lọc
         
         try:
@@ -50,6 +77,8 @@ class DualAudioRecorder:
                 input=True,
                 frames_per_buffer=self.CHUNK
             )
+            self._wf_raw = self._open_wav(self.filename_raw)
+            self._wf_clean = self._open_wav(self.filename_clean)
             self.is_recording = True
             print(f"🎤 Đang ghi âm... (Rate: {self.RATE}Hz)")
         except Exception as e:
@@ -73,23 +102,30 @@ class DualAudioRecorder:
                 data_bytes = self.stream.read(self.CHUNK, exception_on_overflow=False)
                 data_int16 = np.frombuffer(data_bytes, dtype=np.int16)
                 
-                # Lưu vào buffer Raw (giữ nguyên bytes)
-                self.frames_raw.append(data_bytes)
+                # Ghi thẳng vào file Raw (giữ nguyên bytes)
+                self._wf_raw.writeframesraw(data_bytes)
                 
                 # 2. Chuẩn bị dữ liệu cho Processor (int16 -> float32 [-1, 1])
                 # Đây là định dạng mà AudioProcessor mong muốn
-                data_float = data_int16.astype(np.float32) / 32768.0
+                n_in = data_int16.size
+                if n_in > self._float_buf.size:
+                    self._float_buf = np.zeros(n_in, dtype=np.float32)
+                data_float = self._float_buf[:n_in]
+                np.multiply(data_int16, _INV32768, out=data_float, dtype=np.float32)
                 
                 # 3. Xử lý qua AudioProcessor (Lọc + AGC)
                 processed_float = self.processor.process(data_float)
                 
-                # 4. Chuyển đổi ngược lại để lưu file wav (float32 -> int16 -> bytes)
-                # Clip để tránh lỗi tràn số khi convert
-                processed_float = np.clip(processed_float, -1.0, 1.0)
-                processed_int16 = (processed_float * 32767.0).astype(np.int16)
+                # 4. Chuyển đổi ngược lại để lưu file wav (float32 -> int16)
+                # Clip + scale + cast gộp 1 lượt để tránh lỗi tràn số khi convert
+                n = len(processed_float)
+                if n > self._int_buf.size:
+                    self._int_buf = np.zeros(n, dtype=np.int16)
+                out = self._int_buf[:n]
+                _f2i_sat(processed_float, out)
                 
-                # Lưu vào buffer Clean
-                self.frames_clean.append(processed_int16.tobytes())
+                # Ghi thẳng ndarray vào file Clean (không cần tobytes())
+                self._wf_clean.writeframesraw(out)
                 
         except KeyboardInterrupt:
             print("\n⏹️ Dừng bởi người dùng.")
@@ -103,11 +139,12 @@ class DualAudioRecorder:
             self.stream.close()
         self.is_recording = False
         
-        # Lưu file Raw
-        self._save_wav(self.filename_raw, self.frames_raw)
-        
-        # Lưu file Processed
-        self._save_wav(self.filename_clean, self.frames_clean)
+        # Đóng file (wave tự cập nhật header với số frame thực tế khi close)
+        for wf in (self._wf_raw, self._wf_clean):
+            if wf is not None:
+                wf.close()
+        self._wf_raw = None
+        self._wf_clean = None
         
         print("\n✅ Đã xuất file thành công:")
         print(f"   1. {self.filename_raw} (Gốc - có thể nhỏ/ồn)")
@@ -115,17 +152,13 @@ class DualAudioRecorder:
         
         self.p.terminate()
 
-    def _save_wav(self, filename, frames):
-        """Hàm hỗ trợ lưu file WAV"""
-        if not frames:
-            return
-            
+    def _open_wav(self, filename) -> wave.Wave_write:
+        """Hàm hỗ trợ mở file WAV để ghi dần từng chunk"""
         wf = wave.open(filename, 'wb')
         wf.setnchannels(self.CHANNELS)
         wf.setsampwidth(self.p.get_sample_size(self.FORMAT))
         wf.setframerate(self.RATE)
-        wf.writeframes(b''.join(frames))
-        wf.close()
+        return wf
 
 # ==========================================
 # CHẠY TEST
@@ -0,0 +1,94 @@
+"""
+export_onnx.py
+Export model Keras (.h5) của EnvSoundModel sang ONNX để chạy bằng ONNX Runtime.
+Chạy 1 lần (offline), AudioClassifier sẽ tự dùng file .onnx nếu có.
+Tùy chọn --int8: tạo thêm bản INT8 (dynamic quantization), kiểm tra độ chính xác
+trên thư mục wav có nhãn (label/xxx.wav) và bỏ bản INT8 nếu giảm quá 2%.
+
+Cần: pip install tf2onnx onnxruntime
+"""
+
+import argparse
+import os
+
+import librosa
+import numpy as np
+import tensorflow as tf
+import tf2onnx
+from onnxruntime.quantization import quantize_dynamic, QuantType
+
+from audio_classifier import (
+    ENV_MODEL_PATH, ENV_ONNX_PATH, ENV_ONNX_INT8_PATH, ENV_CLASSES,
+    DEFAULT_RATE, EnvSoundModel,
+)
+
+# Độ chính xác tối đa được phép giảm khi dùng INT8
+MAX_ACCURACY_DROP = 0.02
+
+# (batch, time, n_mels, 1) giống preprocess_waveform
+INPUT_SHAPE = (None, 128, 64, 1)
+
+
+def export_onnx(h5_path: str = ENV_MODEL_PATH, onnx_path: str = ENV_ONNX_PATH, opset: int = 17) -> str:
+    """Convert Keras model -> ONNX (batch dynamic, input tên 'mel')"""
+    model = tf.keras.models.load_model(h5_path)
+    spec = (tf.TensorSpec(INPUT_SHAPE, tf.float32, name="mel"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=onnx_path)
+    print(f"✅ Exported {h5_path} -> {onnx_path}")
+    return onnx_path
+
+
+def quantize_onnx(onnx_path: str = ENV_ONNX_PATH, int8_path: str = ENV_ONNX_INT8_PATH) -> str:
+    """ONNX FP32 -> INT8 (dynamic quantization, weights uint8)"""
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+    print(f"✅ Quantized {onnx_path} -> {int8_path}")
+    return int8_path
+
+
+def evaluate_accuracy(onnx_path: str, data_dir: str) -> float:
+    """Độ chính xác trên thư mục wav có nhãn: data_dir/<label>/*.wav"""
+    model = EnvSoundModel(onnx_path=onnx_path)
+    correct = 0
+    total = 0
+    for label in sorted(os.listdir(data_dir)):
+        label_dir = os.path.join(data_dir, label)
+        if label not in ENV_CLASSES or not os.path.isdir(label_dir):
+            continue
+        for name in sorted(os.listdir(label_dir)):
+            if not name.lower().endswith(".wav"):
+                continue
+            y, sr = librosa.load(os.path.join(label_dir, name), sr=DEFAULT_RATE)
+            probs = model.predict_probs(y, sr)
+            correct += int(ENV_CLASSES[int(np.argmax(probs))] == label)
+            total += 1
+    return correct / total if total else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export EnvSoundModel (.h5) sang ONNX")
+    parser.add_argument('--h5', default=ENV_MODEL_PATH, help='Model Keras đầu vào')
+    parser.add_argument('--out', default=ENV_ONNX_PATH, help='File ONNX đầu ra')
+    parser.add_argument('--opset', type=int, default=17, help='ONNX opset version')
+    parser.add_argument('--int8', action='store_true', help='Tạo thêm bản ONNX INT8')
+    parser.add_argument('--int8-out', default=ENV_ONNX_INT8_PATH, help='File ONNX INT8 đầu ra')
+    parser.add_argument('--validate-dir', help='Thư mục wav có nhãn để kiểm tra bản INT8')
+    args = parser.parse_args()
+
+    export_onnx(args.h5, args.out, args.opset)
+
+    if not args.int8:
+        return
+
+    quantize_onnx(args.out, args.int8_out)
+
+    if args.validate_dir:
+        acc_fp32 = evaluate_accuracy(args.out, args.validate_dir)
+        acc_int8 = evaluate_accuracy(args.int8_out, args.validate_dir)
+        print(f"📊 Accuracy FP32: {acc_fp32:.3f} | INT8: {acc_int8:.3f}")
+        if acc_fp32 - acc_int8 > MAX_ACCURACY_DROP:
+            os.remove(args.int8_out)
+            print("❌ INT8 giảm độ chính xác quá nhiều, đã xoá - tiếp tục dùng FP32")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,15 +2,14 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
 import queue
-import time
 import math
 import datetime
 import sys
+from collections import deque
 
 # Import module hệ thống của bạn
 from smart_audio_pipeline import SmartAudioSystem
 from sound_detector import SoundDetector
-from audio_classifier import SoundType
 
 # --- COLOR PALETTE ---
 COLOR_BG_MAIN = "#050a14"
@@ -33,9 +32,16 @@ class SmartAudioGUI:
         self.sound_detector = None
         
         self.is_running = False
-        self.data_queue = queue.Queue()
+        # Queue có giới hạn: UI bị lag thì bỏ bản cũ nhất, tránh dồn update cũ
+        self.data_queue = queue.Queue(maxsize=8)
         self.thread = None
 
+        # Bảng tra cos/sin cho radar (0..359 độ, đã trừ 90 để 0° hướng lên trên)
+        self._radar_lut = [
+            (math.cos(math.radians(a - 90)), math.sin(math.radians(a - 90)))
+            for a in range(360)
+        ]
+
         # --- Setup Styles & UI ---
         self.setup_styles()
         self.setup_ui()
@@ -133,6 +139,9 @@ class SmartAudioGUI:
         scrollbar = ttk.Scrollbar(pnl_log, orient="vertical", command=self.log_tree.yview)
         self.log_tree.configure(yscrollcommand=scrollbar.set)
         
+        # Lưu id các dòng log (cũ nhất ở đầu) để xoá O(1), không cần get_children()
+        self._log_ids = deque(maxlen=50)
+
         self.log_tree.pack(side="left", fill="both", expand=True, padx=5, pady=5)
         scrollbar.pack(side="right", fill="y", pady=5)
 
@@ -210,9 +219,9 @@ class SmartAudioGUI:
         self.canvas.itemconfigure("needle", state="normal")
         c = self.canvas_size // 2
         r = (self.canvas_size // 2) - 25
-        rad = math.radians(angle - 90)
-        x = c + r * math.cos(rad)
-        y = c + r * math.sin(rad)
+        cx, sy = self._radar_lut[int(angle) % 360]
+        x = c + r * cx
+        y = c + r * sy
         self.canvas.coords("needle", c, c, x, y)
         self.lbl_direction.config(text=f"SOURCE: {angle}°", foreground=COLOR_ACCENT)
 
@@ -347,9 +356,11 @@ class SmartAudioGUI:
                 self.data_queue.queue.clear()
 
     def log_event(self, timestamp, detail, conf):
-        self.log_tree.insert("", 0, values=(timestamp, detail, conf))
-        if len(self.log_tree.get_children()) > 50:
-            self.log_tree.delete(self.log_tree.get_children()[-1])
+        if len(self._log_ids) == self._log_ids.maxlen:
+            # deque sẽ tự bỏ id cũ nhất khi append, xoá dòng tương ứng trên tree
+            self.log_tree.delete(self._log_ids[0])
+        iid = self.log_tree.insert("", 0, values=(timestamp, detail, conf))
+        self._log_ids.append(iid)
 
     def processing_loop(self):
         while self.is_running:
@@ -362,12 +373,20 @@ class SmartAudioGUI:
                         direction = self.sound_detector.get_direction()
                     
                     if audio_result:
-                        self.data_queue.put({
+                        item = {
                             "audio": audio_result,
                             "direction": direction,
                             "ts": datetime.datetime.now().strftime("%H:%M:%S")
-                        })
-                time.sleep(0.05)
+                        }
+                        try:
+                            self.data_queue.put_nowait(item)
+                        except queue.Full:
+                            # Drop-oldest: bỏ item cũ nhất rồi đẩy item mới
+                            try:
+                                self.data_queue.get_nowait()
+                            except queue.Empty:
+                                pass
+                            self.data_queue.put_nowait(item)
             except Exception as e:
                 print(f"Loop error: {e}")
                 break
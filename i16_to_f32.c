@@ -0,0 +1,53 @@
+/*
+ * i16_to_f32.c
+ * Đổi int16 -> float32 và nhân scale trong 1 lượt (AVX2 / NEON / scalar).
+ * features_numba.i16_to_f32() tự load qua ctypes nếu đã build, không có thì dùng NumPy.
+ *
+ * Build (đặt file thư viện cạnh features_numba.py):
+ *   Linux:   gcc -O3 -mavx2 -march=native -shared -fPIC -o libi16_to_f32.so i16_to_f32.c
+ *   macOS:   clang -O3 -shared -fPIC -o libi16_to_f32.dylib i16_to_f32.c
+ *   Windows: gcc -O3 -mavx2 -shared -o i16_to_f32.dll i16_to_f32.c
+ */
+
+#include <stddef.h>
+#include <stdint.h>
+
+#if defined(__AVX2__)
+#include <immintrin.h>
+#elif defined(__ARM_NEON)
+#include <arm_neon.h>
+#endif
+
+#ifdef _WIN32
+#define EXPORT __declspec(dllexport)
+#else
+#define EXPORT
+#endif
+
+EXPORT void i16_to_f32_scaled(const int16_t *in, float *out, size_t n, float scale)
+{
+    size_t i = 0;
+#if defined(__AVX2__)
+    /* 16 sample / vòng: int16 -> int32 (2 nửa) -> float32 -> * scale */
+    const __m256 vs = _mm256_set1_ps(scale);
+    for (; i + 16 <= n; i += 16) {
+        __m256i v = _mm256_loadu_si256((const __m256i *)(in + i));
+        __m256i lo = _mm256_cvtepi16_epi32(_mm256_castsi256_si128(v));
+        __m256i hi = _mm256_cvtepi16_epi32(_mm256_extracti128_si256(v, 1));
+        _mm256_storeu_ps(out + i, _mm256_mul_ps(_mm256_cvtepi32_ps(lo), vs));
+        _mm256_storeu_ps(out + i + 8, _mm256_mul_ps(_mm256_cvtepi32_ps(hi), vs));
+    }
+#elif defined(__ARM_NEON)
+    /* 8 sample / vòng */
+    const float32x4_t vs = vdupq_n_f32(scale);
+    for (; i + 8 <= n; i += 8) {
+        int16x8_t v = vld1q_s16(in + i);
+        float32x4_t lo = vcvtq_f32_s32(vmovl_s16(vget_low_s16(v)));
+        float32x4_t hi = vcvtq_f32_s32(vmovl_s16(vget_high_s16(v)));
+        vst1q_f32(out + i, vmulq_f32(lo, vs));
+        vst1q_f32(out + i + 4, vmulq_f32(hi, vs));
+    }
+#endif
+    for (; i < n; i++)
+        out[i] = (float)in[i] * scale;
+}
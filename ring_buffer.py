@@ -0,0 +1,82 @@
+"""
+ring_buffer.py
+Ring buffer 1 producer / 1 consumer (SPSC) dựa trên numpy.
+Chỉ producer sửa `_wr`, chỉ consumer sửa `_rd` nên với GIL không cần lock cho dữ liệu;
+Event chỉ dùng để consumer ngủ khi ring rỗng (không busy-wait).
+Dung lượng làm tròn lên lũy thừa 2 để đổi counter -> slot bằng AND thay cho %.
+"""
+
+import threading
+from typing import Optional
+
+import numpy as np
+
+
+class SPSCRing:
+    def __init__(self, capacity: int, item_shape=(), dtype=np.float32):
+        capacity = 1 << max(0, capacity - 1).bit_length()
+        self.capacity = capacity
+        self._mask = capacity - 1
+        self.buf = np.zeros((capacity,) + tuple(item_shape), dtype=dtype)
+        self._wr = 0  # tổng số item đã ghi (chỉ producer sửa)
+        self._rd = 0  # tổng số item đã đọc (chỉ consumer sửa)
+        self._readable = threading.Event()
+        # view byte của từng slot (tạo 1 lần) cho write_bytes
+        self._slot_bytes = [memoryview(self.buf[i:i + 1]).cast('B') for i in range(capacity)]
+
+    def __len__(self) -> int:
+        return self._wr - self._rd
+
+    def write(self, item) -> bool:
+        """Producer: copy item vào slot kế tiếp. Ring đầy -> bỏ item, trả về False"""
+        if self._wr - self._rd >= self.capacity:
+            return False
+        self.buf[self._wr & self._mask] = item
+        self._wr += 1
+        self._readable.set()
+        return True
+
+    def write_bytes(self, data) -> bool:
+        """
+        Producer: như write() nhưng copy thẳng bytes (vd. in_data của PyAudio) vào slot
+        qua memoryview, không dựng mảng numpy. len(data) phải bằng đúng kích thước slot
+        """
+        if self._wr - self._rd >= self.capacity:
+            return False
+        self._slot_bytes[self._wr & self._mask][:] = data
+        self._wr += 1
+        self._readable.set()
+        return True
+
+    def read(self, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """Consumer: lấy (copy) item cũ nhất, chờ tối đa timeout nếu ring rỗng"""
+        item = self.peek(timeout)
+        if item is None:
+            return None
+        item = item.copy()
+        self._rd += 1
+        return item
+
+    def peek(self, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Consumer: view (không copy) vào item cũ nhất, chờ tối đa timeout nếu ring rỗng.
+        Slot giữ nguyên tới khi gọi advance() -> producer không ghi đè trong lúc đọc
+        """
+        if self._wr == self._rd:
+            if timeout == 0:
+                return None
+            self._readable.clear()
+            # kiểm tra lại sau clear() để không lỡ lần set() của producer
+            if self._wr == self._rd and not self._readable.wait(timeout):
+                return None
+            if self._wr == self._rd:
+                return None
+        return self.buf[self._rd & self._mask]
+
+    def advance(self):
+        """Consumer: trả slot vừa peek() cho producer"""
+        self._rd += 1
+
+    def clear(self):
+        """Consumer: bỏ toàn bộ item đang chờ"""
+        self._rd = self._wr
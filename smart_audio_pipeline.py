@@ -2,96 +2,154 @@
 smart_audio_pipeline.py
 Kết hợp AudioProcessor (lọc nhiễu) và AudioClassifier (nhận diện AI)
 """
-import time
+import threading
 import numpy as np
 from rich.console import Console
 from rich.table import Table
 from rich.live import Live
+from rich.text import Text
 
-from audio_classifier import AudioClassifier, SoundType
+from audio_classifier import AudioClassifier
 from audio_processor import AudioProcessor
+from features_numba import rms
+from ring_buffer import SPSCRing
+
+# Số chunk ring giữa DSP và classifier giữ được (~1s) để hấp thụ độ trễ của model
+PIPELINE_RING_CHUNKS = 16
 
 
 class SmartAudioSystem:
+    """
+    Pipeline 3 tầng chạy song song:
+      PyAudio callback (raw) -> thread DSP -> SPSCRing -> thread classifier -> kết quả mới nhất
+    (env model của classifier infer trên worker riêng, thread classifier không chờ model)
+    process_and_predict() chờ kết quả kế tiếp thay vì tự đọc + xử lý tuần tự.
+    """
+
     def __init__(self):
         self.processor = AudioProcessor(rate=16000)
         self.classifier = AudioClassifier(rate=16000)
         self.is_running = False
         self.console = Console()
 
+        # DSP -> classifier: chunk sạch + meta (rms_raw, rms_clean, gain)
+        self._clean_ring = SPSCRing(PIPELINE_RING_CHUNKS, (self.classifier.CHUNK,), np.float32)
+        self._meta_ring = SPSCRing(PIPELINE_RING_CHUNKS, (3,), np.float64)
+        self._threads = []
+
+        self._result = None
+        self._result_seq = 0
+        self._consumed_seq = 0
+        self._result_cond = threading.Condition()
+
     def start(self):
         self.classifier.start_stream()
         self.is_running = True
         if hasattr(self.processor, "reset_states"):
             self.processor.reset_states()
+        self._clean_ring.clear()
+        self._meta_ring.clear()
+        self._threads = [
+            threading.Thread(target=self._dsp_loop, daemon=True),
+            threading.Thread(target=self._classify_loop, daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
         self.console.print("[bold green]Smart Audio Pipeline Started...[/bold green]")
 
     def stop(self):
         self.is_running = False
+        for t in self._threads:
+            t.join(timeout=2)
+        self._threads = []
         self.classifier.stop_stream()
         self.console.print("[bold red]Stopped.[/bold red]")
 
-    def process_and_predict(self):
-        # 1) Raw
-        raw_chunk = self.classifier.read_audio_chunk()
-        if raw_chunk is None:
-            return None
-
-        # 2) DSP
-        clean_chunk = self.processor.process(raw_chunk)
-
-        # 3) Classify (đã có smoothing + threshold->unknown trong audio_classifier.py)
-        basic_type, features = self.classifier.classify_chunk(clean_chunk)
-
-        env_label = features.get("env_label")
-        env_conf = float(features.get("env_conf", 0.0))
-
-        return {
-            "basic_type": basic_type,
-            "env_label": env_label,
-            "env_conf": env_conf,
-            "rms_raw": float(np.sqrt(np.mean(raw_chunk**2) + 1e-9)),
-            "rms_clean": float(features.get("rms", 0.0)),
-            "gain_applied": getattr(self.processor, "current_gain", 1.0)
-        }
+    def _dsp_loop(self):
+        """Thread DSP: raw chunk (từ callback) -> lọc/AGC -> ring cho classifier"""
+        while self.is_running:
+            # 1) Raw
+            raw_chunk = self.classifier.read_audio_chunk(timeout=0.5)
+            if raw_chunk is None:
+                continue
+
+            # 2) DSP (AGC + clip + RMS đầu ra gộp 1 lượt)
+            clean_chunk, rms_clean = self.processor.process_fused(raw_chunk)
+            meta = (rms(raw_chunk), rms_clean, self.processor.current_gain)
+
+            # chunk ghi trước, meta ghi sau -> classifier đọc meta xong là có chunk
+            if self._clean_ring.write(clean_chunk):
+                self._meta_ring.write(meta)
+
+    def _classify_loop(self):
+        """Thread classifier: lấy chunk sạch từ ring -> rule-based + env model"""
+        while self.is_running:
+            meta = self._meta_ring.read(timeout=0.5)
+            if meta is None:
+                continue
+            clean_chunk = self._clean_ring.read(timeout=0.5)
+            rms_raw, rms_clean, gain = meta
+
+            # 3) Classify (đã có smoothing + threshold->unknown trong audio_classifier.py)
+            basic_type, features = self.classifier.classify_chunk(clean_chunk, rms=rms_clean)
+
+            result = {
+                "basic_type": basic_type,
+                "env_label": features.get("env_label"),
+                "env_conf": float(features.get("env_conf", 0.0)),
+                "rms_raw": float(rms_raw),
+                "rms_clean": float(features.get("rms", 0.0)),
+                "gain_applied": float(gain)
+            }
+            with self._result_cond:
+                self._result = result
+                self._result_seq += 1
+                self._result_cond.notify_all()
+
+    def process_and_predict(self, timeout: float = 0.5):
+        """Chờ kết quả mới kế tiếp từ thread classifier (None nếu timeout)"""
+        with self._result_cond:
+            if not self._result_cond.wait_for(
+                lambda: self._result_seq != self._consumed_seq, timeout
+            ):
+                return None
+            self._consumed_seq = self._result_seq
+            return self._result
 
     def run_demo(self):
         self.start()
 
         try:
-            table = Table(title="Smart Audio Analysis (DSP + AI)", show_lines=True)
-            table.add_column("DSP Status", style="cyan", width=25)
-            table.add_column("Basic Type", style="magenta", width=15)
-            table.add_column("AI Prediction (Smoothed)", style="green", justify="center")
-
-            with Live(table, refresh_per_second=4, console=self.console) as live:
+            # Table tạo 1 lần, mỗi frame chỉ sửa nội dung 3 ô Text -> Live tự render lại
+            dsp_text = Text("")
+            basic_text = Text("")
+            ai_text = Text("N/A (buffer/hop/rms)")
+
+            table = Table(title="Smart Audio Analysis (DSP + AI)", box=None)
+            table.add_column("DSP Processing", style="dim cyan")
+            table.add_column("Basic Detection", style="magenta")
+            table.add_column("AI Classification", style="bold white")
+            table.add_row(dsp_text, basic_text, ai_text)
+
+            with Live(table, refresh_per_second=4, console=self.console):
                 while self.is_running:
                     result = self.process_and_predict()
 
                     if result:
-                        dsp_info = (
+                        dsp_text.plain = (
                             f"Gain: {result['gain_applied']:.1f}x\n"
                             f"RMS In : {result['rms_raw']:.4f}\n"
                             f"RMS Out: {result['rms_clean']:.4f}"
                         )
-                        basic = result["basic_type"].value.upper()
+                        basic_text.plain = result["basic_type"].value.upper()
 
                         if result["env_label"] is None:
-                            ai_text = "N/A (buffer/hop/rms)"
+                            ai_text.plain = "N/A (buffer/hop/rms)"
+                            ai_text.style = ""
                         else:
                             conf_percent = result["env_conf"] * 100
-                            color = "bold green" if conf_percent > 70 else "yellow"
-                            ai_text = f"[{color}]{result['env_label'].upper()}\n({conf_percent:.1f}%)[/{color}]"
-
-                        # refresh table
-                        table = Table(title="Smart Audio Analysis (DSP + AI)", box=None)
-                        table.add_column("DSP Processing", style="dim cyan")
-                        table.add_column("Basic Detection", style="magenta")
-                        table.add_column("AI Classification", style="bold white")
-                        table.add_row(dsp_info, basic, ai_text)
-                        live.update(table)
-
-                    time.sleep(0.05)
+                            ai_text.plain = f"{result['env_label'].upper()}\n({conf_percent:.1f}%)"
+                            ai_text.style = "bold green" if conf_percent > 70 else "yellow"
 
         except KeyboardInterrupt:
             self.stop()
@@ -2,6 +2,8 @@
 
 import usb.core
 import usb.util
+import array
+import struct
 import time
 from typing import Optional, Dict, Tuple
 
@@ -9,8 +11,34 @@ from typing import Optional, Dict, Tuple
 class Tuning:
     TIMEOUT = 100000
 
+    # param_id -> (offset, is_float)
+    _META = {
+        19: (32, False),
+        21: (0, False),
+        22: (22, False),
+        6: (3, True),
+    }
+    # param_id -> (wValue của lệnh đọc, is_float), tính sẵn từ _META
+    _READ_CMD = {
+        pid: (0x80 | off | (0 if is_float else 0x40), is_float)
+        for pid, (off, is_float) in _META.items()
+    }
+    # Compile format 1 lần, đọc thẳng từ buffer USB (không cần bytes(response))
+    _UNPACK = struct.Struct('<ii').unpack_from
+    # param_id -> TTL (giây) dùng lại giá trị vừa đọc: tham số đổi chậm so với tick ~64ms
+    # (VAD/DOA không cache, luôn đọc mới)
+    _TTL = {
+        6: 0.5,   # AGCGAIN
+        22: 0.2,  # SPEECHDETECTED
+    }
+
     def __init__(self, dev):
         self.dev = dev
+        # param_id -> (value, hạn dùng theo time.monotonic())
+        self._cache = {}
+        # Buffer nhận 8 byte dùng lại: ctrl_transfer ghi thẳng vào đây thay vì cấp phát
+        # bytes + array + slice mỗi lần (mỗi SoundDetector chỉ đọc từ 1 thread)
+        self._resp = array.array('B', bytes(8))
 
     def write(self, name, value):
         try:
@@ -19,43 +47,30 @@ class Tuning:
                 0, 0, int(name), [int(value)], self.TIMEOUT)
         except usb.core.USBError as e:
             print(f"USB Error khi ghi {name}: {e}")
+        self._cache.clear()
 
     def read(self, name):
         try:
-            params = {
-                19: 'int',
-                21: 'int',
-                22: 'int',
-                6: 'float'
-            }
-            
             param_id = int(name)
-            param_type = params.get(param_id, 'int')
-            
-            offsets = {
-                19: 32,
-                21: 0,
-                22: 22,
-                6: 3
-            }
-            
-            offset = offsets.get(param_id, 0)
+            ttl = self._TTL.get(param_id)
+            if ttl is not None:
+                now = time.monotonic()
+                hit = self._cache.get(param_id)
+                if hit is not None and now < hit[1]:
+                    return hit[0]
+            cmd, is_float = self._READ_CMD.get(param_id, (0xC0, False))
             
-            cmd = 0x80 | offset
-            if param_type == 'int':
-                cmd |= 0x40
+            resp = self._resp
+            if self.dev.ctrl_transfer(
+                    usb.util.CTRL_IN | usb.util.CTRL_TYPE_VENDOR | usb.util.CTRL_RECIPIENT_DEVICE,
+                    0, cmd, param_id, resp, self.TIMEOUT) < 8:
+                return None
             
-            response = self.dev.ctrl_transfer(
-                usb.util.CTRL_IN | usb.util.CTRL_TYPE_VENDOR | usb.util.CTRL_RECIPIENT_DEVICE,
-                0, cmd, param_id, 8, self.TIMEOUT)
-            
-            import struct
-            result = struct.unpack('ii', bytes(response))
-            
-            if param_type == 'int':
-                return result[0]
-            else:
-                return result[0] * (2.0 ** result[1])
+            a, b = self._UNPACK(resp)
+            value = a * (2.0 ** b) if is_float else a
+            if ttl is not None:
+                self._cache[param_id] = (value, now + ttl)
+            return value
                 
         except Exception as e:
             return None
@@ -109,12 +124,18 @@ class SoundDetector:
     VENDOR_ID = 0x2886
     PRODUCT_ID = 0x0018
 
+    # Thời gian (giây) dùng lại snapshot trước khi đọc USB lại
+    SNAPSHOT_TTL = 0.08
+
     def __init__(self):
         self.dev = None
         self.tuning = None
         self.connected = False
         self._last_direction = 0
         self._last_vad_state = 0
+        # Snapshot (vad, speech, direction) đọc cùng lúc trong 1 tick
+        self._snapshot: Optional[Tuple] = None
+        self._snap_ts = 0.0
 
     def connect(self) -> bool:
         """
@@ -148,8 +169,41 @@ class SoundDetector:
             except:
                 pass
         self.connected = False
+        self._snapshot = None
         print("🔌 Đã ngắt kết nối")
 
+    def refresh(self) -> Tuple:
+        """
+        Đọc VAD, speech, DOA liền nhau 1 lần và lưu snapshot
+        (AGC gain không cần mỗi tick -> chỉ đọc trong get_status)
+        Returns: (vad, speech, direction)
+        """
+        tuning = self.tuning
+        self._snapshot = (tuning.read(19), tuning.read(22), tuning.read(21))
+        self._snap_ts = time.monotonic()
+        return self._snapshot
+
+    def read_state(self) -> Tuple[bool, bool, Optional[int]]:
+        """
+        Đọc trạng thái cho 1 tick: VAD/DOA luôn đọc mới, speech qua cache TTL của Tuning,
+        không qua SNAPSHOT_TTL (giao thức tuning XMOS chỉ đọc được 1 tham số mỗi transfer)
+        Returns: (vad, speech, direction)
+        """
+        if not self.connected:
+            return False, False, None
+        
+        vad, speech, direction = self.refresh()
+        self._last_vad_state = vad
+        if direction is not None:
+            self._last_direction = direction
+        return bool(vad), bool(speech), direction
+
+    def _get_snapshot(self) -> Tuple:
+        """Snapshot hiện tại, chỉ đọc lại USB khi đã quá SNAPSHOT_TTL"""
+        if self._snapshot is None or time.monotonic() - self._snap_ts > self.SNAPSHOT_TTL:
+            return self.refresh()
+        return self._snapshot
+
     def get_direction(self) -> Optional[int]:
         """
         Lấy hướng âm thanh (Direction of Arrival)
@@ -158,7 +212,7 @@ class SoundDetector:
         if not self.connected:
             return None
         
-        direction = self.tuning.direction
+        direction = self._get_snapshot()[2]
         if direction is not None:
             self._last_direction = direction
         return direction
@@ -171,7 +225,7 @@ class SoundDetector:
         if not self.connected:
             return False
         
-        vad = self.tuning.is_voice
+        vad = self._get_snapshot()[0]
         self._last_vad_state = vad
         return bool(vad)
 
@@ -183,7 +237,7 @@ class SoundDetector:
         if not self.connected:
             return False
         
-        return bool(self.tuning.speech_detected)
+        return bool(self._get_snapshot()[1])
 
     def get_status(self) -> Dict:
         """
@@ -196,12 +250,13 @@ class SoundDetector:
                 'error': 'Not connected to device'
             }
 
+        vad, speech, direction = self.read_state()
         return {
             'connected': True,
-            'vad': self.is_voice_detected(),
-            'speech': self.is_speech_detected(),
-            'direction': self.get_direction(),
-            'agc_gain': self.tuning.agc_gain,
+            'vad': vad,
+            'speech': speech,
+            'direction': direction,
+            'agc_gain': self.tuning.read(6),
             'timestamp': time.time()
         }
 
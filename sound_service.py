@@ -1,46 +1,154 @@
 """Sound Detection Service - Main integration module"""
 
+import os
+import sys
 import time
 import threading
 import queue
+import itertools
+from collections import namedtuple
 from datetime import datetime
 from typing import Dict, List, Optional
-from collections import deque
 
+import numpy as np
+
+from features_numba import count_event
 from sound_detector import SoundDetector
 from audio_classifier import AudioClassifier, SoundType
 
 
+# Số cửa sổ audio tối đa chờ worker classify
+INFERENCE_QUEUE_SIZE = 2
+# Chu kỳ poll phần cứng khi không có audio làm nhịp (10 Hz)
+POLL_INTERVAL_NS = 100_000_000
+# Im lặng liên tục quá IDLE_AFTER_TICKS tick -> giãn poll ra 2 Hz tới khi có VAD lại
+IDLE_AFTER_TICKS = 20
+IDLE_POLL_INTERVAL_NS = 500_000_000
+# Statistics/history luôn lấy mẫu theo lưới 10 Hz, độc lập với nhịp tick (audio ~15.6 Hz,
+# gom cửa sổ, poll idle 2 Hz): tick trễ nhiều slot thì đếm bù, tối đa STATS_MAX_CATCHUP slot
+STATS_INTERVAL_NS = 100_000_000
+STATS_MAX_CATCHUP = 10
+
+# Snapshot state của 1 tick: bất biến, _run_loop thay cả object (gán tham chiếu là atomic)
+State = namedtuple('State', 'vad speech direction sound_type rms timestamp_ns')
+
+# Mã định danh tăng dần cho mỗi instance service (không dùng id(): id có thể bị dùng lại
+# sau khi instance cũ bị giải phóng)
+_INSTANCE_IDS = itertools.count(1)
+
+# bit trong flags_arr của history
+_FLAG_VAD = 1
+_FLAG_SPEECH = 2
+
+# index -> SoundType.value (dùng khi xuất history)
+_ST_VALUES = tuple(st.value for st in SoundType)
+
+
+def _wall_offset_ns() -> int:
+    """Độ lệch giờ hệ thống - monotonic (ns), lấy 1 lần cho mỗi lần xuất dữ liệu"""
+    return time.time_ns() - time.monotonic_ns()
+
+
+def _ns_to_iso(ns: int, offset_ns: Optional[int] = None) -> str:
+    """time.monotonic_ns() -> chuỗi ISO giờ hệ thống (chỉ gọi khi xuất ra ngoài)"""
+    if offset_ns is None:
+        offset_ns = _wall_offset_ns()
+    return datetime.fromtimestamp((ns + offset_ns) / 1e9).isoformat()
+
+
+def _pin_thread(cpu: int) -> bool:
+    """Ghim thread hiện tại vào CPU `cpu` (Linux). Returns: False nếu không ghim được"""
+    if not hasattr(os, 'sched_setaffinity'):
+        return False
+    try:
+        os.sched_setaffinity(0, {cpu})  # 0 = thread đang gọi
+        return True
+    except OSError:  # CPU không tồn tại / không nằm trong cpuset được phép
+        return False
+
+
+def _raise_thread_priority() -> bool:
+    """
+    Tăng độ ưu tiên cho thread hiện tại (best-effort).
+    Linux: SCHED_RR cần root hoặc CAP_SYS_NICE. Returns: False nếu không nâng được
+    """
+    try:
+        if sys.platform.startswith('linux'):
+            policy = os.SCHED_RR
+            os.sched_setscheduler(0, policy, os.sched_param(os.sched_get_priority_min(policy)))
+            return True
+        if sys.platform == 'win32':
+            import ctypes
+            THREAD_PRIORITY_HIGHEST = 2
+            kernel32 = ctypes.windll.kernel32
+            return bool(kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY_HIGHEST))
+    except (OSError, AttributeError):
+        pass
+    return False
+
+
 class SoundDetectionService:
     
+    # Bảng/format dựng sẵn cho print_status (index theo SoundType.index, bool)
+    _TYPE_NAME = tuple(st.value.upper() for st in SoundType)
+    _VAD_ICON = ("[ - ]", "[VAD]")
+    _SPEECH_ICON = ("[  -   ]", "[SPEECH]")
+    _STATUS_FMT = "%s VAD | %s Speech | Dir: %s° | Type: %s\n"
+    
     def __init__(self, 
                  enable_audio_classification: bool = True,
-                 history_size: int = 100):
+                 history_size: int = 100,
+                 quantize_model: bool = False,
+                 audio_cpu: Optional[int] = None,
+                 realtime_priority: bool = False):
+        self.instance_id = next(_INSTANCE_IDS)
         self.sound_detector = SoundDetector()
-        self.audio_classifier = AudioClassifier() if enable_audio_classification else None
+        # quantize_model: env model INT8 (ONNX INT8 nếu có, không thì TFLite dynamic-range)
+        self.audio_classifier = (AudioClassifier(quantize=quantize_model)
+                                 if enable_audio_classification else None)
         
         self.enable_audio_classification = enable_audio_classification
+        # CPU ghim thread sensor (None = để OS tự chọn)
+        self.audio_cpu = audio_cpu
+        # Nâng priority thread sensor (SCHED_RR / THREAD_PRIORITY_HIGHEST) - tùy chọn
+        self.realtime_priority = realtime_priority
         
         self.is_running = False
         self.thread = None
         
-        self.history = deque(maxlen=history_size)
+        # Thread sensor (_run_loop) đẩy cửa sổ audio sang worker classify qua queue nhỏ:
+        # đầy thì bỏ cửa sổ cũ nhất, sensor không bao giờ chờ model
+        self.classify_thread = None
+        self._inf_queue: "queue.Queue[np.ndarray]" = queue.Queue(maxsize=INFERENCE_QUEUE_SIZE)
+        # Kết quả mới nhất của worker: (sound_type, rms) - gán cả tuple 1 lần
+        self._latest = (SoundType.UNKNOWN, 0)
+        self.windows_dropped = 0  # cửa sổ bị bỏ vì worker classify không theo kịp
+        
+        # History dạng SoA (ring buffer): mỗi field 1 mảng, slot ghi = _hist_n & _hist_mask.
+        # Dung lượng = lũy thừa 2 > history_size: wrap bằng AND thay cho %, và slot đang ghi
+        # không bao giờ nằm trong history_size event gần nhất mà get_history() đọc
+        self.history_size = history_size
+        cap = 1 << history_size.bit_length()
+        self._hist_mask = cap - 1
+        self.ts_arr = np.zeros(cap, dtype=np.int64)        # time.monotonic_ns()
+        self.dir_arr = np.full(cap, -1, dtype=np.int16)    # -1 = không có hướng
+        self.st_arr = np.zeros(cap, dtype=np.uint8)        # index trong SoundType
+        self.flags_arr = np.zeros(cap, dtype=np.uint8)     # _FLAG_VAD | _FLAG_SPEECH
+        self._hist_n = 0  # tổng số event đã ghi
         self.statistics = {
             'total_detections': 0,
             'vad_count': 0,
             'speech_count': 0,
-            'sound_types': {st.value: 0 for st in SoundType},
-            'direction_histogram': [0] * 12
+            'sound_types': np.zeros(len(SoundType), dtype=np.int64),
+            'direction_histogram': np.zeros(12, dtype=np.int64)
         }
         
-        self.current_state = {
-            'vad': False,
-            'speech': False,
-            'direction': None,
-            'sound_type': SoundType.UNKNOWN,
-            'rms': 0,
-            'timestamp': None
-        }
+        self.current_state = State(False, False, None, SoundType.UNKNOWN, 0, None)
+        # Tăng khi (vad, speech, direction, sound_type) đổi -> API dùng lại JSON đã serialize
+        self.state_version = 0
+        self._state_key = None
+        # notify_all mỗi lần state_version tăng (và khi stop) -> client SSE thức dậy
+        self._state_cond = threading.Condition()
 
     def start(self) -> bool:
         print("=" * 60)
@@ -57,6 +165,9 @@ class SoundDetectionService:
                 self.enable_audio_classification = False
         
         self.is_running = True
+        if self.enable_audio_classification:
+            self.classify_thread = threading.Thread(target=self._classify_loop, daemon=True)
+            self.classify_thread.start()
         self.thread = threading.Thread(target=self._run_loop, daemon=True)
         self.thread.start()
         
@@ -71,9 +182,13 @@ class SoundDetectionService:
         print("\nStopping service...")
         
         self.is_running = False
+        with self._state_cond:
+            self._state_cond.notify_all()
         
         if self.thread:
             self.thread.join(timeout=5)
+        if self.classify_thread:
+            self.classify_thread.join(timeout=5)
         
         # Cleanup
         self.sound_detector.disconnect()
@@ -84,116 +199,223 @@ class SoundDetectionService:
         print("Service stopped")
 
     def _run_loop(self):
-        """Main service loop"""
+        """Thread sensor - nhịp theo audio callback (không polling bằng sleep): đọc phần cứng + cập nhật state"""
         print("Service loop running...")
+        if self.audio_cpu is not None:
+            if _pin_thread(self.audio_cpu):
+                print(f"   - Sensor thread pinned to CPU {self.audio_cpu}")
+            else:
+                print(f"   (Không ghim được thread sensor vào CPU {self.audio_cpu})")
+        if self.realtime_priority and not _raise_thread_priority():
+            print("   (Không nâng được priority thread sensor - Linux cần root/CAP_SYS_NICE)")
+        
+        # Gán method/hằng dùng mỗi tick vào biến local 1 lần (tránh tra thuộc tính trong vòng lặp)
+        read_window = (self.audio_classifier.read_audio_window
+                       if self.enable_audio_classification else None)
+        submit_window = self._submit_window
+        read_state = self.sound_detector.read_state
+        update_statistics = self._update_statistics
+        add_to_history = self._add_to_history
+        monotonic_ns = time.monotonic_ns
+        state_cond = self._state_cond
+        SPEECH, SILENCE = SoundType.SPEECH, SoundType.SILENCE
+        next_tick = next_stats = monotonic_ns()
+        silent_ticks = 0
         
         while self.is_running:
             try:
-                # Get hardware status
-                vad = self.sound_detector.is_voice_detected()
-                speech = self.sound_detector.is_speech_detected()
-                direction = self.sound_detector.get_direction()
+                # Chờ chunk audio mới từ callback (block tối đa 0.5s)
+                chunk = None
+                if read_window is not None:
+                    # gom các frame còn chờ thành 1 cửa sổ -> 1 lần classify cho cả cụm
+                    chunk = read_window(timeout=0.5)
+                    if chunk is None:
+                        continue
+                    submit_window(chunk.copy())  # chunk là buffer dùng lại
+                else:
+                    # Không có audio làm nhịp -> poll phần cứng 10 Hz, tick kế tính từ tick
+                    # trước (bù thời gian đọc USB), trễ quá 1 tick thì đồng bộ lại
+                    next_tick += (IDLE_POLL_INTERVAL_NS if silent_ticks > IDLE_AFTER_TICKS
+                                  else POLL_INTERVAL_NS)
+                    delay = next_tick - monotonic_ns()
+                    if delay > 0:
+                        time.sleep(delay / 1e9)
+                    else:
+                        next_tick = monotonic_ns()
                 
-                # Classify audio
-                sound_type = SoundType.UNKNOWN
-                rms = 0
+                # Đọc đồng hồ 1 lần mỗi tick, ngay khi có dữ liệu (không tính thời gian đọc USB)
+                now_ns = monotonic_ns()
                 
-                if self.enable_audio_classification:
-                    sound_type, features = self.audio_classifier.classify_audio()
-                    rms = features.get('rms', 0)
-                else:
+                # sound_type/rms: kết quả mới nhất worker đã classify xong
+                sound_type, rms = self._latest
+                
+                # Get hardware status (đọc USB 1 lần cho mỗi frame audio)
+                vad, speech, direction = read_state()
+                
+                if chunk is None:
                     # Fallback: VAD-based classification
-                    if vad:
-                        sound_type = SoundType.SPEECH
-                    else:
-                        sound_type = SoundType.SILENCE
+                    sound_type = SPEECH if vad else SILENCE
+                    silent_ticks = 0 if vad else silent_ticks + 1
                 
                 # Update current state
-                self.current_state = {
-                    'vad': vad,
-                    'speech': speech,
-                    'direction': direction,
-                    'sound_type': sound_type,
-                    'rms': rms,
-                    'timestamp': datetime.now()
-                }
-                
-                self._update_statistics(self.current_state)
+                state = State(vad, speech, direction, sound_type, rms, now_ns)
+                self.current_state = state
                 
-                # Save to history (only significant events)
-                if vad or sound_type != SoundType.SILENCE:
-                    self._add_to_history(self.current_state)
+                state_key = (vad, speech, direction, sound_type)
+                if state_key != self._state_key:
+                    self._state_key = state_key
+                    with state_cond:
+                        self.state_version += 1
+                        state_cond.notify_all()
                 
-                time.sleep(0.1)
+                # Statistics/history theo lưới 10 Hz: mỗi slot đã tới hạn đếm 1 lần
+                if now_ns >= next_stats:
+                    slots = (now_ns - next_stats) // STATS_INTERVAL_NS + 1
+                    if slots > STATS_MAX_CATCHUP:
+                        # treo quá lâu (lỗi, USB chậm) -> không đếm bù cả khoảng, đồng bộ lại
+                        slots = STATS_MAX_CATCHUP
+                        next_stats = now_ns + STATS_INTERVAL_NS
+                    else:
+                        next_stats += slots * STATS_INTERVAL_NS
+                    for _ in range(slots):
+                        update_statistics(state)
+                    
+                    # Save to history (only significant events), tối đa 1 bản ghi / slot tới hạn
+                    if vad or sound_type is not SILENCE:
+                        add_to_history(state)
                 
             except Exception as e:
                 print(f"Error in service loop: {e}")
                 time.sleep(1)
 
-    def _update_statistics(self, state: Dict):
+    def _submit_window(self, window: np.ndarray):
+        """Đẩy cửa sổ sang worker, queue đầy thì bỏ cửa sổ cũ nhất (không block)"""
+        try:
+            self._inf_queue.put_nowait(window)
+        except queue.Full:
+            try:
+                self._inf_queue.get_nowait()
+                self.windows_dropped += 1
+            except queue.Empty:
+                pass
+            self._inf_queue.put_nowait(window)
+
+    def _classify_loop(self):
+        """Worker classify: lấy cửa sổ từ queue -> rule-based + env model"""
+        while self.is_running:
+            try:
+                window = self._inf_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                sound_type, features = self.audio_classifier.classify_chunk(window)
+                self._latest = (sound_type, features.get('rms', 0))
+            except Exception as e:
+                print(f"Error in classify worker: {e}")
+
+    def _update_statistics(self, state: State):
         self.statistics['total_detections'] += 1
         
-        if state['vad']:
+        if state.vad:
             self.statistics['vad_count'] += 1
         
-        if state['speech']:
+        if state.speech:
             self.statistics['speech_count'] += 1
         
-        sound_type = state['sound_type']
-        if isinstance(sound_type, SoundType):
-            self.statistics['sound_types'][sound_type.value] += 1
-        
-        direction = state['direction']
-        if direction is not None:
-            # Convert direction to LED bin (0-11)
-            led_bin = int((direction + 15) % 360 / 30) % 12
-            self.statistics['direction_histogram'][led_bin] += 1
-
-    def _add_to_history(self, state: Dict):
-        """Add event to history"""
-        event = {
-            'timestamp': state['timestamp'].isoformat(),
-            'vad': state['vad'],
-            'speech': state['speech'],
-            'direction': state['direction'],
-            'sound_type': state['sound_type'].value if isinstance(state['sound_type'], SoundType) else str(state['sound_type'])
-        }
-        self.history.append(event)
+        # sound type + direction -> LED bin (0-11) đếm trong 1 lần gọi kernel
+        direction = state.direction
+        count_event(self.statistics['sound_types'],
+                    state.sound_type.index,
+                    self.statistics['direction_histogram'],
+                    -1 if direction is None else int(direction))
+
+    def _add_to_history(self, state: State):
+        """Add event to history (ghi vô hướng vào từng mảng)"""
+        i = self._hist_n & self._hist_mask
+        direction = state.direction
+        self.ts_arr[i] = state.timestamp_ns
+        self.dir_arr[i] = -1 if direction is None else int(direction)
+        self.st_arr[i] = state.sound_type.index
+        self.flags_arr[i] = (_FLAG_VAD if state.vad else 0) | (_FLAG_SPEECH if state.speech else 0)
+        self._hist_n += 1
+
+    @property
+    def history_count(self) -> int:
+        """Tổng số event đã ghi vào history (đổi => history đổi)"""
+        return self._hist_n
+
+    def _history_index(self, limit: int) -> np.ndarray:
+        """Index các slot của limit event gần nhất (cũ -> mới)"""
+        end = self._hist_n
+        n = max(0, min(limit, end, self.history_size))
+        return np.arange(end - n, end) & self._hist_mask
 
     def get_current_state(self) -> Dict:
-        state = self.current_state.copy()
-        if isinstance(state.get('sound_type'), SoundType):
-            state['sound_type'] = state['sound_type'].value
-        if isinstance(state.get('timestamp'), datetime):
-            state['timestamp'] = state['timestamp'].isoformat()
-        return state
+        return self.state_to_dict(self.current_state)  # 1 lần đọc tham chiếu -> các field cùng 1 tick
+
+    @staticmethod
+    def state_to_dict(state: State) -> Dict:
+        """State (snapshot 1 tick) -> dict JSON của /status"""
+        return {
+            'vad': state.vad,
+            'speech': state.speech,
+            'direction': state.direction,
+            'sound_type': state.sound_type.value,
+            'rms': state.rms,
+            'timestamp': _ns_to_iso(state.timestamp_ns) if state.timestamp_ns is not None else None
+        }
+
+    def wait_state_change(self, version: int, timeout: float) -> int:
+        """Chờ state_version khác `version` (hoặc service dừng), tối đa timeout. Trả về version hiện tại"""
+        with self._state_cond:
+            self._state_cond.wait_for(
+                lambda: self.state_version != version or not self.is_running, timeout
+            )
+            return self.state_version
 
     def get_statistics(self) -> Dict:
-        """Get statistics"""
-        return self.statistics.copy()
+        """Get statistics (dict mới, không chia sẻ mảng đếm với service)"""
+        stats = self.statistics
+        dir_hist = stats['direction_histogram']
+        dir_total = int(dir_hist.sum())
+        return {
+            'total_detections': stats['total_detections'],
+            'vad_count': stats['vad_count'],
+            'speech_count': stats['speech_count'],
+            'sound_types': dict(zip(_ST_VALUES, stats['sound_types'].tolist())),
+            'direction_histogram': dir_hist.tolist(),
+            'direction_probabilities': (dir_hist / dir_total).tolist() if dir_total else [0.0] * 12,
+            'audio_frames_dropped': self.audio_classifier.frames_dropped if self.audio_classifier else 0,
+            'windows_dropped': self.windows_dropped
+        }
 
     def get_history(self, limit: int = 50) -> List[Dict]:
-        """Get event history"""
-        return list(self.history)[-limit:]
+        """Get event history (limit event gần nhất, cũ -> mới)"""
+        idx = self._history_index(limit)
+        # monotonic -> giờ hệ thống cho cả lô bằng 1 phép cộng mảng
+        wall_ts = ((self.ts_arr[idx] + _wall_offset_ns()) / 1e9).tolist()
+        return [
+            {
+                'timestamp': datetime.fromtimestamp(ts).isoformat(),
+                'vad': bool(flags & _FLAG_VAD),
+                'speech': bool(flags & _FLAG_SPEECH),
+                'direction': None if d < 0 else d,
+                'sound_type': _ST_VALUES[st]
+            }
+            for ts, d, st, flags in zip(wall_ts, self.dir_arr[idx].tolist(),
+                                        self.st_arr[idx].tolist(), self.flags_arr[idx].tolist())
+        ]
 
     def print_status(self):
         """Print current status to console"""
-        state = self.current_state
-        
-        vad_icon = "[VAD]" if state['vad'] else "[ - ]"
-        speech_icon = "[SPEECH]" if state['speech'] else "[  -   ]"
-        direction = state['direction'] if state['direction'] is not None else "N/A"
-        
-        sound_type = state['sound_type']
-        if isinstance(sound_type, SoundType):
-            sound_type_str = sound_type.value
-        else:
-            sound_type_str = str(sound_type)
-        
-        print(f"{vad_icon} VAD | "
-              f"{speech_icon} Speech | "
-              f"Dir: {direction}° | "
-              f"Type: {sound_type_str.upper()}")
+        state = self.current_state  # _run_loop luôn lưu SoundType chuẩn
+        direction = state.direction if state.direction is not None else "N/A"
+        sys.stdout.write(self._STATUS_FMT % (
+            self._VAD_ICON[bool(state.vad)],
+            self._SPEECH_ICON[bool(state.speech)],
+            direction,
+            self._TYPE_NAME[state.sound_type.index]
+        ))
 
     def monitor_console(self, interval: float = 0.5):
         """Monitor and print to console"""
@@ -235,19 +457,21 @@ def main():
         print("\n" + "=" * 60)
         print("STATISTICS:")
         print("=" * 60)
-        stats = service.get_statistics()
+        stats = service.statistics
         print(f"  Total detections: {stats['total_detections']}")
         print(f"  VAD triggers: {stats['vad_count']}")
         print(f"  Speech detections: {stats['speech_count']}")
         print(f"\n  Sound type distribution:")
-        for sound_type, count in stats['sound_types'].items():
-            if count > 0:
-                print(f"    {sound_type:8}: {count}")
+        # chỉ các loại có count > 0, nhiều -> ít
+        type_counts = stats['sound_types']
+        order = np.argsort(-type_counts, kind='stable')  # giữ thứ tự enum khi bằng nhau
+        for i in order[type_counts[order] > 0].tolist():
+            print(f"    {_ST_VALUES[i]:8}: {type_counts[i]}")
         print(f"\n  Direction distribution:")
-        for i, count in enumerate(stats['direction_histogram']):
-            angle = i * 30
-            bar = '█' * int(count / 10) if count > 0 else ''
-            print(f"    {angle:3}: {bar} ({count})")
+        dir_counts = stats['direction_histogram'].tolist()
+        bar_lens = (stats['direction_histogram'] // 10).tolist()
+        for i in range(12):
+            print(f"    {i * 30:3}: {'█' * bar_lens[i]} ({dir_counts[i]})")
         
         print("\nGoodbye!")
 